@@ -1,4 +1,3 @@
-import re
 import os
 from typing import Optional
 
@@ -7,15 +6,11 @@ from openai import AsyncOpenAI
 
 from state import State
 from utils.custom_css import message_hover_animation
+from utils.validation import validate_question, check_rate_limit
 from components.chat_message import Message
+from utils.logger import get_logger
 
-
-def is_japanese(text: str) -> bool:
-    """
-    Check if the given text contains Japanese characters.
-    """
-    japanese_pattern = re.compile(r'[\u3040-\u30FF\u4E00-\u9FAF]')
-    return bool(japanese_pattern.search(text))
+logger = get_logger("chat_input")
 
 
 class ChatInput(ui.row):
@@ -49,6 +44,7 @@ class ChatInput(ui.row):
         self.message_text = message_text
         self.message_container = message_container
         self.client_state = client_state
+        self.busy = False
 
         # Create the input field and buttons for sending messages and recording
         with self.classes('w-full no-wrap items-center'):
@@ -73,21 +69,28 @@ class ChatInput(ui.row):
         question = getattr(self.input_question, 'value', '')
         if question is None:
             return
-        elif len(question) == 0:
-            ui.notify('質問を入力してから送信ボタンを押してください！', type='warning', close_button=True, position='top')
+
+        # Ignore clicks while a previous message is still being checked or answered
+        if self.busy:
             return
-        elif len(question) <= 2:
-            ui.notify('質問を細かく書いてください！', type='warning', close_button=True, position='top')
+
+        # Validate the input in-process (length, Japanese text)
+        warning = validate_question(question)
+        if warning is not None:
+            ui.notify(warning, type='warning', close_button=True, position='top')
             return
 
-        # Disable the send button while processing
+        # Disable the send button while processing. This happens before the first await, so a
+        # double-click cannot start a second turn while the rate-limit check is in flight.
+        self.busy = True
         self.send_button.props(add='disable loading')
 
-        # Check if the input is in Japanese
-        is_japanese_text = await run.cpu_bound(is_japanese, question)
-        if not is_japanese_text:
+        # The rate-limit counters may live in SQLite or Redis, so that check runs off the event loop
+        warning = await run.io_bound(check_rate_limit, self.client_state.session_id, self.client_state.client_ip)
+        if warning is not None:
+            ui.notify(warning, type='warning', close_button=True, position='top')
             self.send_button.props(remove='disable loading')
-            ui.notify('日本語で書いてください！', type='warning', close_button=True, position='top')
+            self.busy = False
             return
 
         # Clear the input field and display the user's message
@@ -128,11 +131,12 @@ class ChatInput(ui.row):
         except Exception as e:
             # Handle errors and notify the user
             error_message = f"エラーが発生しました: {str(e)}"
-            print(f"Error: {error_message}")
+            logger.exception("Error: %s", error_message)
             with response_message.add_slot('default'):
                 response_message.stored_text = error_message
                 ui.markdown(error_message)
             ui.run_javascript('window.scrollTo(0, document.body.scrollHeight)')
 
         # Re-enable the send button after processing
-        self.send_button.props(remove='disable loading')
\ No newline at end of file
+        self.send_button.props(remove='disable loading')
+        self.busy = False
\ No newline at end of file
@@ -7,19 +7,24 @@ import os
 client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 from utils.prompt import EXTRACT_KEYWORDS_PROMPT
+from utils.logger import get_logger
 
-async def extract_keywords_and_sort_order(conversation: List[Dict[str, str]], max_keywords: int = 4) -> Dict[str, Union[List[str], str]]:
+logger = get_logger("create_keywords")
+
+async def extract_keywords_and_sort_order(conversation: List[Dict[str, str]], max_keywords: int = 4, max_variants: int = 2) -> Dict[str, Union[List[str], str]]:
     """
     Asynchronously analyze a conversation and extract up to `max_keywords` for searching items,
-    along with the sort order.
+    along with the sort order and up to `max_variants` alternative keyword strings.
 
     Args:
         conversation (List[Dict[str, str]]): The conversation history, where each message is a dictionary
                                              with "role" (e.g., "user", "assistant") and "content".
         max_keywords (int): The maximum number of keywords to extract.
+        max_variants (int): The maximum number of alternative keyword strings.
 
     Returns:
-        Dict[str, Union[List[str], str]]: A dictionary containing extracted keywords and the sort order.
+        Dict[str, Union[List[str], str]]: A dictionary containing extracted keywords, the sort order
+                                          and the keyword variants.
     """
     try:
         # Add a system message to guide the assistant
@@ -45,15 +50,18 @@ async def extract_keywords_and_sort_order(conversation: List[Dict[str, str]], ma
         # Split the response into keywords and sort order
         lines = response_content.split("\n")
         keywords = lines[0].split()  # Space-separated keywords
-        sort_order = lines[1] if len(lines) > 1 and lines[1].strip() else "score:desc"  # Default to "score:desc" if not provided
+        sort_order = lines[1].strip() if len(lines) > 1 and lines[1].strip() else "score:desc"  # Default to "score:desc" if not provided
+
+        # Any further lines are alternative keyword strings, searched concurrently with the main keywords
+        keyword_variants = [" ".join(line.split()[:max_keywords]) for line in lines[2:] if line.strip()]
 
         # Limit the number of keywords to the specified max_keywords
-        print(f"Extracted Keywords: {keywords}, Sort Order: {sort_order}")
-        return {"keywords": keywords[:max_keywords], "sort_order": sort_order}
+        logger.info("Extracted Keywords: %s, Sort Order: %s, Variants: %s", keywords, sort_order, keyword_variants)
+        return {"keywords": keywords[:max_keywords], "sort_order": sort_order, "keyword_variants": keyword_variants[:max_variants]}
 
     except Exception as e:
-        print(f"Error extracting keywords and sort order: {e}")
-        return {"keywords": [], "sort_order": "score:desc"}
+        logger.exception("Error extracting keywords and sort order: %s", e)
+        return {"keywords": [], "sort_order": "score:desc", "keyword_variants": []}
 
 # async def main():
 #     # Example conversation
@@ -0,0 +1,160 @@
+import re
+import sqlite3
+from typing import List, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger("item_store")
+
+# Columns copied from the dictionaries returned by `search_mercari`
+ITEM_FIELDS = [
+    "name", "url", "price", "description", "picture", "category", "size", "condition",
+    "shipping_cost", "shipping_method", "shipping_region", "shipping_time", "likes",
+]
+
+ORDER_BY_OPTIONS = {
+    "position": "search_no DESC, position ASC",
+    "price:asc": "price_value IS NULL, price_value ASC",
+    "price:desc": "price_value IS NULL, price_value DESC",
+    "num_likes:desc": "likes_value IS NULL, likes_value DESC",
+}
+
+# Trigram FTS matches substrings of 3+ characters, which suits Japanese text without word boundaries
+FTS_MIN_QUERY_LENGTH = 3
+
+
+def parse_item_id(url: str) -> str:
+    """
+    Extract the Mercari item ID from an item URL, e.g. ".../item/m12345678" -> "m12345678".
+    Falls back to the URL itself when it does not look like an item URL.
+    """
+    match = re.search(r"/(?:item|shops/product)/([A-Za-z0-9]+)", url or "")
+    return match.group(1) if match else url
+
+
+def parse_number(text: str) -> Optional[int]:
+    """
+    Parse a displayed number such as "¥1,234" or "12" into an integer. Returns None if there is no number.
+    """
+    digits = re.sub(r"[^\d]", "", text or "")
+    return int(digits) if digits else None
+
+
+class ItemStore:
+    """
+    Per-session store of the items already shown to the user, backed by an in-memory SQLite database.
+    Items are indexed by item ID and by their position in the search that returned them, with a
+    full-text index over name and description, so follow-up questions can be answered locally
+    instead of scraping Mercari again.
+    """
+
+    def __init__(self) -> None:
+        self.connection = sqlite3.connect(":memory:", check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.search_count = 0
+
+        columns = ", ".join(f"{field} TEXT" for field in ITEM_FIELDS)
+        self.connection.execute(
+            f"CREATE TABLE items (item_id TEXT PRIMARY KEY, search_no INTEGER, position INTEGER, "
+            f"price_value INTEGER, likes_value INTEGER, {columns})"
+        )
+        self.connection.execute("CREATE INDEX items_position ON items (search_no, position)")
+
+        # Full-text search is optional: older SQLite builds lack FTS5 or the trigram tokenizer
+        try:
+            self.connection.execute(
+                "CREATE VIRTUAL TABLE items_fts USING fts5(item_id UNINDEXED, name, description, tokenize='trigram')"
+            )
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            logger.warning("SQLite FTS5 trigram tokenizer is unavailable; falling back to LIKE queries")
+            self.has_fts = False
+
+    def add_items(self, items: List[dict]) -> None:
+        """
+        Store the results of one search. Positions start at 1 in the order the items were returned.
+        An item seen again replaces its older entry.
+
+        Args:
+            items (List[dict]): Items returned by `search_mercari`.
+        """
+        if not items:
+            return
+        self.search_count += 1
+
+        with self.connection:
+            for position, item in enumerate(items, start=1):
+                item_id = parse_item_id(item.get("url", ""))
+                values = [str(item.get(field, "")) for field in ITEM_FIELDS]
+                self.connection.execute(
+                    f"INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, {', '.join('?' * len(ITEM_FIELDS))})",
+                    [item_id, self.search_count, position,
+                     parse_number(item.get("price", "")), parse_number(item.get("likes", "")), *values],
+                )
+                if self.has_fts:
+                    self.connection.execute("DELETE FROM items_fts WHERE item_id = ?", [item_id])
+                    self.connection.execute(
+                        "INSERT INTO items_fts VALUES (?, ?, ?)",
+                        [item_id, item.get("name", ""), item.get("description", "")],
+                    )
+
+    def query(
+            self,
+            positions: Optional[List[int]] = None,
+            item_ids: Optional[List[str]] = None,
+            text: Optional[str] = None,
+            min_price: Optional[int] = None,
+            max_price: Optional[int] = None,
+            order_by: str = "position",
+            limit: int = 5,
+        ) -> List[dict]:
+        """
+        Look up previously shown items. All given filters are combined with AND.
+
+        Args:
+            positions (Optional[List[int]]): 1-based positions in the most recent search results.
+            item_ids (Optional[List[str]]): Mercari item IDs (e.g. "m12345678").
+            text (Optional[str]): Text to match against item names and descriptions.
+            min_price (Optional[int]): Minimum price in yen.
+            max_price (Optional[int]): Maximum price in yen.
+            order_by (str): One of "position", "price:asc", "price:desc", "num_likes:desc".
+            limit (int): Maximum number of items to return.
+
+        Returns:
+            List[dict]: Matching items, each with its `item_id` and `position` added.
+        """
+        conditions, params = [], []
+
+        if positions:
+            conditions.append(f"search_no = ? AND position IN ({', '.join('?' * len(positions))})")
+            params += [self.search_count, *positions]
+        if item_ids:
+            conditions.append(f"item_id IN ({', '.join('?' * len(item_ids))})")
+            params += item_ids
+        if text:
+            if self.has_fts and len(text) >= FTS_MIN_QUERY_LENGTH:
+                # Quote the text so FTS treats it as one phrase instead of query syntax
+                conditions.append("item_id IN (SELECT item_id FROM items_fts WHERE items_fts MATCH ?)")
+                params.append('"' + text.replace('"', '""') + '"')
+            else:
+                conditions.append("(name LIKE ? OR description LIKE ?)")
+                params += [f"%{text}%", f"%{text}%"]
+        if min_price is not None:
+            conditions.append("price_value >= ?")
+            params.append(min_price)
+        if max_price is not None:
+            conditions.append("price_value <= ?")
+            params.append(max_price)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = ORDER_BY_OPTIONS.get(order_by, ORDER_BY_OPTIONS["position"])
+        rows = self.connection.execute(
+            f"SELECT item_id, position, {', '.join(ITEM_FIELDS)} FROM items {where} ORDER BY {order} LIMIT ?",
+            [*params, limit],
+        ).fetchall()
+
+        logger.info("Item store query matched %d item(s)", len(rows))
+        return [dict(row) for row in rows]
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM items").fetchone()[0]
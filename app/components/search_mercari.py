@@ -1,10 +1,651 @@
-from playwright.sync_api import sync_playwright
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from playwright.sync_api import sync_playwright, Error as PlaywrightError
+
+from components.item_store import parse_item_id, parse_number
+from utils.dedupe import NearDuplicateIndex
+from utils.item_table import PRICE_SORTS, ItemTable
+from utils.logger import get_logger, get_hot_logger
+from utils.metrics import metrics
+from utils.resilience import CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded, retry
+from utils.storage import StorageError, get_storage
+
+logger = get_logger("search_mercari")
+item_logger = get_hot_logger("search_mercari")
+
+MERCARI_URL = "https://jp.mercari.com"
+
+# Number of items returned to the model
+RESULT_SIZE = 5
+# Number of grid-level candidates fetched once per keyword query and re-ranked locally afterwards
+SUPERSET_SIZE = int(os.getenv("SEARCH_SUPERSET_SIZE", "40"))
+# Set SEARCH_LOCAL_RERANK=0 to scrape a fresh listing for every sort order and filter
+LOCAL_RERANK = os.getenv("SEARCH_LOCAL_RERANK", "1") != "0"
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", "600"))
+# Cached results older than the TTL are still served while Mercari is slow or down;
+# this is also how long they are kept in the storage backend
+SEARCH_STALE_TTL_SECONDS = int(os.getenv("SEARCH_STALE_TTL_SECONDS", "86400"))
+# Maximum number of keyword queries (main keywords + variants) searched concurrently
+MAX_QUERIES = 3
+# Reciprocal rank fusion constant used when merging the results of several queries
+RRF_K = 60
+# Browsers running at the same time across all searches; each query in a fan-out takes one slot
+BROWSER_SLOTS = threading.BoundedSemaphore(int(os.getenv("SEARCH_MAX_BROWSERS", "4")))
+
+# Time budget of one search, instead of Playwright's 30 s default per wait.
+# The grid stage gets a share of it, each detail page at most DETAIL_PAGE_TIMEOUT_SECONDS of what is left.
+SEARCH_DEADLINE_SECONDS = float(os.getenv("SEARCH_DEADLINE_SECONDS", "45"))
+GRID_STAGE_SHARE = 0.4
+DETAIL_PAGE_TIMEOUT_SECONDS = float(os.getenv("SEARCH_DETAIL_TIMEOUT_SECONDS", "8"))
+# Attempts per page load; retries use jittered exponential backoff within the deadline
+SCRAPE_ATTEMPTS = 2
+# Below this budget a page load is not started: it would only time out and count as a Mercari failure
+MIN_SCRAPE_SECONDS = float(os.getenv("SEARCH_MIN_SCRAPE_SECONDS", "2"))
+
+# Stops new scrapes after repeated failures (e.g. a Mercari outage or a changed page layout)
+mercari_breaker = CircuitBreaker(
+    "mercari",
+    failure_threshold=int(os.getenv("SEARCH_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("SEARCH_BREAKER_RESET_SECONDS", "60")),
+)
+
+
+class BrowserUnavailableError(RuntimeError):
+    """
+    Raised when no browser could be started within the deadline (no free slot, or a slow launch).
+    Mercari was not contacted, so this does not count against the circuit breaker.
+    """
 
 
-def search_mercari(keywords: str, sort_order: str = "score:desc") -> list:
+# Failures that mean Mercari could not be scraped right now
+SCRAPE_ERRORS = (PlaywrightError, DeadlineExceeded, CircuitOpenError, BrowserUnavailableError)
+
+# Mercari search URL parameters for each sort order
+SORT_PARAMETERS = {
+    "score:desc": {"sort": "score", "order": "desc"},
+    "created_time:desc": {"sort": "created_time", "order": "desc"},
+    "price:asc": {"sort": "price", "order": "asc"},
+    "price:desc": {"sort": "price", "order": "desc"},
+    "num_likes:desc": {"sort": "num_likes", "order": "desc"},
+}
+
+# Item condition labels (as shown on the item page) and their search filter IDs
+CONDITION_IDS = {
+    "新品、未使用": 1,
+    "未使用に近い": 2,
+    "目立った傷や汚れなし": 3,
+    "やや傷や汚れあり": 4,
+    "傷や汚れあり": 5,
+    "全体的に状態が悪い": 6,
+}
+
+# Shipping payer options: search filter ID and the label shown in the item's shipping cost
+SHIPPING_PAYERS = {
+    "seller": {"id": 2, "label": "出品者負担"},
+    "buyer": {"id": 1, "label": "購入者負担"},
+}
+
+ITEM_CELL_SELECTOR = "div#item-grid ul li[data-testid='item-cell']"
+# Shown instead of the grid when nothing matches, so an empty search does not wait for the timeout
+EMPTY_RESULT_SELECTOR = "p:has-text('出品された商品がありません')"
+
+# Cache keys in the storage backend (shared by all replicas unless STORAGE_BACKEND=memory):
+# keyword query -> ItemTable.to_dict(), item ID -> {"fetched_at": ..., "details": ...}
+TABLE_KEY_PREFIX = "search:table:"
+DETAILS_KEY_PREFIX = "search:details:"
+
+
+class SearchUnavailableError(RuntimeError):
     """
-    Synchronous function to search for items on Mercari using Playwright with Firefox.
+    Raised when Mercari cannot be searched right now and no cached results can be served.
+    """
+
+
+class BrowserSession:
+    """
+    Launches Firefox on first use only, so searches answered entirely from the caches never start a browser.
     Instead using chrome, we use Firefox to avoid detected as a bot.
+    """
+
+    def __init__(self) -> None:
+        self._playwright = None
+        self._browser = None
+        self.context = None
+        self._has_slot = False
+
+    def __enter__(self) -> "BrowserSession":
+        return self
+
+    def new_page(self, deadline: Optional[Deadline] = None):
+        """
+        Open a new tab, starting the browser first if needed. Waiting for a browser slot and
+        launching the browser both stay within `deadline`; `BrowserUnavailableError` is raised otherwise.
+        """
+        if self.context is None:
+            # Wait for a free browser slot so concurrent searches share a bounded browser capacity
+            if not self._has_slot:
+                with metrics.timed("search.browser_slot_wait"):
+                    acquired = BROWSER_SLOTS.acquire(timeout=deadline.remaining() if deadline is not None else None)
+                if not acquired:
+                    metrics.incr("search.browser_slot_timeout")
+                    raise BrowserUnavailableError("No free browser slot within the search deadline")
+                self._has_slot = True
+            try:
+                if self._playwright is None:
+                    self._playwright = sync_playwright().start()
+                if self._browser is None:
+                    self._browser = self._playwright.firefox.launch(headless=True, timeout=_timeout_ms(deadline))
+            except (PlaywrightError, DeadlineExceeded) as e:
+                raise BrowserUnavailableError(f"Failed to launch the browser: {e}") from e
+            self.context = self._browser.new_context(locale="ja-JP")
+        return self.context.new_page()
+
+    def __exit__(self, *exc_info) -> None:
+        try:
+            if self.context is not None:
+                self.context.close()
+            if self._browser is not None:
+                self._browser.close()
+            if self._playwright is not None:
+                self._playwright.stop()
+        finally:
+            if self._has_slot:
+                BROWSER_SLOTS.release()
+
+
+def build_search_url(
+        keywords: str,
+        sort_order: str,
+        min_price: Optional[int] = None,
+        max_price: Optional[int] = None,
+        conditions: Optional[List[str]] = None,
+        shipping_payer: Optional[str] = None,
+    ) -> str:
+    """
+    Build the Mercari search URL for on-sale items, letting Mercari apply the sort order and filters.
+    """
+    params = {"keyword": keywords, "status": "on_sale", **SORT_PARAMETERS[sort_order]}
+    if min_price is not None:
+        params["price_min"] = min_price
+    if max_price is not None:
+        params["price_max"] = max_price
+    if conditions:
+        params["item_condition_id"] = ",".join(str(CONDITION_IDS[condition]) for condition in conditions if condition in CONDITION_IDS)
+    if shipping_payer in SHIPPING_PAYERS:
+        params["shipping_payer_id"] = SHIPPING_PAYERS[shipping_payer]["id"]
+    return f"{MERCARI_URL}/search?{urlencode(params)}"
+
+
+def _timeout_ms(deadline: Optional[Deadline]) -> Optional[float]:
+    # None lets Playwright use its default timeout
+    return deadline.timeout_ms() if deadline is not None else None
+
+
+def scrape_grid(session: BrowserSession, url: str, limit: int, deadline: Optional[Deadline] = None) -> Tuple[List[dict], bool]:
+    """
+    Scrape grid-level data (no detail pages) from a search result page.
+
+    Args:
+        session (BrowserSession): The browser session to use.
+        url (str): The search URL.
+        limit (int): Maximum number of items to collect.
+        deadline (Optional[Deadline]): Time budget for every wait on the page.
+
+    Returns:
+        Tuple[List[dict], bool]: Rows with item ID, name, URL, thumbnail and price, and whether the
+                                 listing contained every matching item.
+    """
+    page = session.new_page(deadline)
+    try:
+        page.goto(url, timeout=_timeout_ms(deadline))
+
+        # Wait for the search results (or the empty result message) to load
+        page.wait_for_selector(f"{ITEM_CELL_SELECTOR} img, {EMPTY_RESULT_SELECTOR}", timeout=_timeout_ms(deadline))
+
+        # The grid renders lazily, so scroll until enough cells exist or no more appear
+        cells = page.query_selector_all(ITEM_CELL_SELECTOR)
+        while len(cells) < limit and not (deadline is not None and deadline.expired()):
+            page.mouse.wheel(0, 3000)
+            page.wait_for_timeout(300)
+            more_cells = page.query_selector_all(ITEM_CELL_SELECTOR)
+            if len(more_cells) == len(cells):
+                break
+            cells = more_cells
+        has_next_page = page.query_selector("[data-testid='pagination-next-button']") is not None
+
+        rows = []
+        for cell in cells[:limit]:
+            link_element = cell.query_selector("a[data-testid='thumbnail-link']")
+            href = link_element.get_attribute("href") if link_element else None
+            # Skip Mercari Shops items, they are skipped on the detail page anyway
+            if not href or href.startswith("/shops/"):
+                continue
+
+            name_element = cell.query_selector("span[data-testid='thumbnail-item-name']")
+            price_element = cell.query_selector("span[class*='number']")
+            image_element = cell.query_selector("img")
+            rows.append({
+                "item_id": parse_item_id(href),
+                "name": name_element.inner_text() if name_element else "No name",
+                "url": MERCARI_URL + href,
+                "thumbnail": image_element.get_attribute("src") if image_element else "No picture",
+                "price": parse_number(price_element.inner_text()) if price_element else None,
+            })
+
+        return rows, len(cells) < limit and not has_next_page
+    finally:
+        page.close()
+
+
+def scrape_item_details(session: BrowserSession, url: str, deadline: Optional[Deadline] = None) -> Optional[dict]:
+    """
+    Open an item page and extract its details.
+    Errors (e.g. timeouts) are raised to the caller instead of returning placeholder values.
+
+    Returns:
+        Optional[dict]: The item details, or None if the item is from Mercari Shops.
+    """
+    item_data = {}
+    new_tab = session.new_page(deadline)
+
+    try:
+        # Check if the item is from a shop (skip if "data-testid='mercari-shops-banner-icon'" is found)
+        new_tab.goto(url, timeout=_timeout_ms(deadline))
+        shop_banner_element = new_tab.query_selector("div[data-testid='mercari-shops-banner-icon']")
+        if shop_banner_element:
+            logger.info("Skipping shop item (%s) - Detected as Mercari Shops", url)
+            return None
+
+        # Wait for the parent container to be fully loaded
+        new_tab.wait_for_selector("div#item-info[data-testid='item-detail-container']", state="attached", timeout=_timeout_ms(deadline))
+
+        # Wait for the price element to load
+        item_logger.debug("Waiting for price element to load...")
+        new_tab.wait_for_selector("div[data-testid='price'] span:nth-child(2)", state="visible", timeout=_timeout_ms(deadline))
+        price_element = new_tab.query_selector("div[data-testid='price'] span:nth-child(2)") or \
+                        new_tab.query_selector("div[data-testid='product-price'] span:nth-child(2)")
+        item_data["price"] = price_element.inner_text() if price_element else "No price"
+
+        # Extract the description (handle multiple patterns)
+        item_logger.debug("Extracting description...")
+        description_element = new_tab.query_selector("pre[data-testid='description']")
+        item_data["description"] = description_element.inner_text() if description_element else "No description"
+
+        # Extract the picture URL
+        item_logger.debug("Extracting picture URL...")
+        picture_element = new_tab.query_selector("div[data-testid='carousel-item'] img")
+        item_data["picture"] = picture_element.get_attribute("src") if picture_element else "No picture"
+
+        # Extract additional details (handle multiple patterns)
+        item_logger.debug("Extracting additional details...")
+        category_element = new_tab.query_selector("div[data-testid='item-detail-category']") or \
+                           new_tab.query_selector("div[data-testid='product-detail-category']")
+        item_data["category"] = category_element.inner_text() if category_element else "No category"
+
+        size_element = new_tab.query_selector("span[data-testid='商品のサイズ']")
+        item_data["size"] = size_element.inner_text() if size_element else "No size"
+
+        condition_element = new_tab.query_selector("span[data-testid='商品の状態']")
+        item_data["condition"] = condition_element.inner_text() if condition_element else "No condition"
+
+        shipping_cost_element = new_tab.query_selector("span[data-testid='配送料の負担']")
+        item_data["shipping_cost"] = shipping_cost_element.inner_text() if shipping_cost_element else "No shipping cost"
+
+        shipping_method_element = new_tab.query_selector("span[data-testid='配送の方法']")
+        item_data["shipping_method"] = shipping_method_element.inner_text() if shipping_method_element else "No shipping method"
+
+        shipping_region_element = new_tab.query_selector("span[data-testid='発送元の地域']")
+        item_data["shipping_region"] = shipping_region_element.inner_text() if shipping_region_element else "No shipping region"
+
+        shipping_time_element = new_tab.query_selector("span[data-testid='発送までの日数']")
+        item_data["shipping_time"] = shipping_time_element.inner_text() if shipping_time_element else "No shipping time"
+
+        # Extract the number of likes
+        item_logger.debug("Extracting number of likes...")
+        like_element = new_tab.query_selector("div[data-testid='icon-heart-button'] span.merText.body__5616e150.inherit__5616e150")
+        item_data["likes"] = like_element.inner_text() if like_element else "No likes"
+
+        # Only log a short summary; full descriptions are large
+        if item_logger.isEnabledFor(logging.DEBUG):
+            item_logger.debug("Extracted details: %s (%s)", url, item_data["price"])
+
+    finally:
+        # Close the tab after extracting the data
+        new_tab.close()
+
+    return item_data
+
+
+# -------------------------- Caches -------------------------- #
+# Storage errors only cost a cache miss (or a lost write); searches never fail because of them.
+def _get_table(cache_key: str, max_age: float = SEARCH_CACHE_TTL_SECONDS) -> Optional[ItemTable]:
+    # Entries past `max_age` are kept (for stale serving) until the storage TTL expires
+    try:
+        data = get_storage().get(TABLE_KEY_PREFIX + cache_key)
+    except StorageError as e:
+        logger.warning("Failed to read cached superset: %s", e)
+        return None
+    if data is None or time.time() - data["fetched_at"] > max_age:
+        return None
+    return ItemTable.from_dict(data)
+
+
+def _store_table(cache_key: str, table: ItemTable) -> None:
+    try:
+        get_storage().set(TABLE_KEY_PREFIX + cache_key, table.to_dict(), ttl=SEARCH_STALE_TTL_SECONDS)
+    except StorageError as e:
+        logger.warning("Failed to cache superset: %s", e)
+
+
+def _get_cached_details(item_ids: List[str]) -> Dict[str, dict]:
+    """
+    Read the cached detail entries of several items in one batch.
+    """
+    try:
+        entries = get_storage().get_many([DETAILS_KEY_PREFIX + item_id for item_id in item_ids])
+    except StorageError as e:
+        logger.warning("Failed to read cached item details: %s", e)
+        return {}
+    return {key[len(DETAILS_KEY_PREFIX):]: entry for key, entry in entries.items()}
+
+
+def _fresh_details(entry: Optional[dict], max_age: float = SEARCH_CACHE_TTL_SECONDS) -> Optional[dict]:
+    if entry is None or time.time() - entry["fetched_at"] > max_age:
+        return None
+    return entry["details"]
+
+
+def _store_details(details_by_id: Dict[str, dict]) -> None:
+    """
+    Cache the details of several items in one batch.
+    """
+    if not details_by_id:
+        return
+    now = time.time()
+    try:
+        get_storage().set_many(
+            {DETAILS_KEY_PREFIX + item_id: {"fetched_at": now, "details": details} for item_id, details in details_by_id.items()},
+            ttl=SEARCH_STALE_TTL_SECONDS,
+        )
+    except StorageError as e:
+        logger.warning("Failed to cache item details: %s", e)
+
+
+# -------------------------- Guarded Scraping -------------------------- #
+def _guarded(function: Callable, deadline: Deadline):
+    """
+    Run one scrape behind the circuit breaker, retrying transient Playwright errors within the deadline.
+    Running out of our own budget (deadline, browser slot or launch) is not counted as a Mercari failure,
+    and no attempt is started with less than MIN_SCRAPE_SECONDS left.
+    """
+    if deadline.remaining() < MIN_SCRAPE_SECONDS:
+        metrics.incr("search.skipped_low_budget")
+        raise DeadlineExceeded(f"Only {deadline.remaining():.1f}s left, not starting a scrape")
+    mercari_breaker.check()
+    try:
+        result = retry(function, SCRAPE_ATTEMPTS, (PlaywrightError,), deadline, min_attempt_seconds=MIN_SCRAPE_SECONDS)
+    except (DeadlineExceeded, BrowserUnavailableError):
+        mercari_breaker.record_cancelled()
+        raise
+    except Exception:
+        mercari_breaker.record_failure()
+        raise
+    mercari_breaker.record_success()
+    return result
+
+
+def _scrape_grid_guarded(url: str, limit: int, deadline: Deadline) -> Tuple[List[dict], bool]:
+    def attempt():
+        with BrowserSession() as session:
+            return scrape_grid(session, url, limit, deadline)
+    return _guarded(attempt, deadline)
+
+
+def _scrape_item_details_guarded(session: BrowserSession, url: str, deadline: Deadline) -> Optional[dict]:
+    page_deadline = deadline.stage(1.0, max_seconds=DETAIL_PAGE_TIMEOUT_SECONDS)
+    return _guarded(lambda: scrape_item_details(session, url, page_deadline), page_deadline)
+
+
+# -------------------------- Search -------------------------- #
+def collect_items(
+        session: BrowserSession,
+        rows: List[dict],
+        conditions: Optional[List[str]] = None,
+        shipping_payer: Optional[str] = None,
+        limit: int = RESULT_SIZE,
+        deadline: Optional[Deadline] = None,
+    ) -> List[dict]:
+    """
+    Fetch details (from the cache when possible) for candidate rows in order, applying the
+    detail-level filters, until `limit` items are collected.
+
+    Near-duplicate listings (similar title at a close price, or the same thumbnail) of an item
+    already collected are skipped using grid-level data only, before any detail tab is opened.
+
+    Items whose page cannot be loaded are served from stale cached details or left out, never
+    returned with placeholder values. Collecting stops early when the deadline runs out.
+    Raises `SearchUnavailableError` if nothing could be collected because of scrape failures.
+    """
+    if deadline is None:
+        deadline = Deadline(SEARCH_DEADLINE_SECONDS)
+
+    # One batched read for every candidate, and one batched write for the details fetched below
+    cached = _get_cached_details([row["item_id"] for row in rows])
+    fetched: Dict[str, dict] = {}
+    try:
+        return _collect_rows(session, rows, cached, fetched, conditions, shipping_payer, limit, deadline)
+    finally:
+        _store_details(fetched)
+
+
+def _collect_rows(
+        session: BrowserSession,
+        rows: List[dict],
+        cached: Dict[str, dict],
+        fetched: Dict[str, dict],
+        conditions: Optional[List[str]],
+        shipping_payer: Optional[str],
+        limit: int,
+        deadline: Deadline,
+    ) -> List[dict]:
+    # The loop of `collect_items`; freshly scraped details are added to `fetched` for caching
+    items = []
+    kept = NearDuplicateIndex()
+    collapsed = fetches_avoided = failures = 0
+    for row in rows:
+        if len(items) >= limit:
+            break
+
+        if kept.is_duplicate(row):
+            collapsed += 1
+            if _fresh_details(cached.get(row["item_id"])) is None:
+                fetches_avoided += 1
+            continue
+
+        details = _fresh_details(cached.get(row["item_id"]))
+        if details is not None:
+            metrics.incr("search.details.cache_hit")
+        else:
+            if deadline.remaining() < MIN_SCRAPE_SECONDS:
+                logger.warning("Search deadline reached after %d item(s)", len(items))
+                metrics.incr("search.deadline_exceeded")
+                break
+
+            metrics.incr("search.details.fetch")
+            try:
+                details = _scrape_item_details_guarded(session, row["url"], deadline)
+            except SCRAPE_ERRORS as e:
+                failures += 1
+                logger.warning("Failed to extract details for %s: %s", row["url"], e)
+                details = _fresh_details(cached.get(row["item_id"]), max_age=SEARCH_STALE_TTL_SECONDS)
+                if details is None:
+                    continue
+                metrics.incr("search.stale_served")
+            else:
+                if details is None:
+                    continue
+                fetched[row["item_id"]] = details
+
+        # Condition and shipping payer are only known from the item page
+        if conditions and details["condition"] not in conditions:
+            continue
+        if shipping_payer in SHIPPING_PAYERS and SHIPPING_PAYERS[shipping_payer]["label"] not in details["shipping_cost"]:
+            continue
+
+        items.append({"name": row["name"], "url": row["url"], **details})
+        kept.add(row)
+
+    if collapsed:
+        metrics.incr("search.dedupe.collapsed", collapsed)
+        metrics.incr("search.dedupe.fetches_avoided", fetches_avoided)
+        logger.info("Collapsed %d near-duplicate listing(s), %d detail fetch(es) avoided", collapsed, fetches_avoided)
+    if not items and failures:
+        raise SearchUnavailableError("メルカリの商品ページを読み込めませんでした。しばらくしてからもう一度お試しください。")
+    return items
+
+
+def _superset_candidates(
+        keywords: str,
+        sort_order: str,
+        min_price: Optional[int],
+        max_price: Optional[int],
+        deadline: Deadline,
+    ) -> Tuple[List[dict], bool]:
+    """
+    Return the candidate rows for one keyword query from the cached superset, fetching it first if needed.
+    If the fetch fails (or the circuit breaker is open), a stale superset is served when there is one.
+
+    Returns:
+        Tuple[List[dict], bool]: Candidate rows in the requested order, and whether the superset is exhaustive.
+    """
+    cache_key = " ".join(keywords.split())
+    table = _get_table(cache_key)
+
+    # A new superset listing is only needed for unseen keywords or an order whose listing is not cached
+    if table is None or not table.can_sort(sort_order):
+        try:
+            rows, exhaustive = _scrape_grid_guarded(build_search_url(keywords, sort_order), SUPERSET_SIZE, deadline)
+        except SCRAPE_ERRORS as e:
+            table = _get_table(cache_key, max_age=SEARCH_STALE_TTL_SECONDS)
+            if table is None:
+                raise
+            logger.warning("Serving stale superset for '%s': %s", cache_key, e)
+            metrics.incr("search.stale_served")
+            # The stale table may lack the requested listing. Price orders are approximated from the
+            # cached prices (better than nothing during an outage); other orders fall back to one it has
+            if not table.can_sort(sort_order) and sort_order not in PRICE_SORTS:
+                sort_order = next(iter(table.ranks))
+        else:
+            if table is None:
+                table = ItemTable()
+            table.merge(rows, sort_order, exhaustive)
+            _store_table(cache_key, table)
+            metrics.incr("search.superset.fetch")
+            logger.info("Fetched superset for '%s' (%s): %d rows", cache_key, sort_order, len(rows))
+    else:
+        metrics.incr("search.superset.hit")
+        logger.info("Re-ranking cached superset for '%s' (%s) locally", cache_key, sort_order)
+
+    with metrics.timed("search.superset.select"):
+        candidates = [table.row(index) for index in table.select(sort_order, min_price, max_price)]
+        return candidates, table.is_exhaustive()
+
+
+def _live_candidates(
+        keywords: str,
+        sort_order: str,
+        min_price: Optional[int],
+        max_price: Optional[int],
+        conditions: Optional[List[str]],
+        shipping_payer: Optional[str],
+        deadline: Deadline,
+    ) -> List[dict]:
+    """
+    Return the candidate rows for one keyword query from a live listing sorted and filtered by Mercari.
+    """
+    metrics.incr("search.live_scrape")
+    url = build_search_url(keywords, sort_order, min_price, max_price, conditions, shipping_payer)
+    rows, _ = _scrape_grid_guarded(url, SUPERSET_SIZE, deadline)
+    return rows
+
+
+def _fan_out(function: Callable, queries: List[str]) -> list:
+    """
+    Run `function(query)` for every query concurrently, one thread (and browser, bounded by
+    `BROWSER_SLOTS`) per query. Failed queries are logged and left out; if every query fails,
+    the first error is raised.
+    """
+    if len(queries) == 1:
+        return [function(queries[0])]
+
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        # Each thread runs in a copy of the current context, so log records keep their correlation IDs
+        futures = [executor.submit(contextvars.copy_context().run, function, query) for query in queries]
+
+    results, errors = [], []
+    for query, future in zip(queries, futures):
+        try:
+            results.append(future.result())
+        except Exception as e:
+            logger.warning("Search for '%s' failed: %s", query, e)
+            errors.append(e)
+    if not results:
+        raise errors[0]
+    return results
+
+
+def merge_candidates(candidate_lists: List[List[dict]], sort_order: str) -> List[dict]:
+    """
+    Merge the candidates of several keyword queries, de-duplicating by item ID.
+
+    Price orders are re-applied on the merged rows. Other orders are combined with reciprocal rank
+    fusion, so items ranked high by several queries come first.
+    """
+    scores: Dict[str, float] = {}
+    rows: Dict[str, dict] = {}
+    for candidates in candidate_lists:
+        for rank, row in enumerate(candidates):
+            rows.setdefault(row["item_id"], row)
+            scores[row["item_id"]] = scores.get(row["item_id"], 0.0) + 1.0 / (RRF_K + rank)
+
+    # Dictionaries keep insertion order, and `sorted` is stable, so ties keep the first query's order
+    merged = sorted(rows.values(), key=lambda row: -scores[row["item_id"]])
+    if sort_order in ("price:asc", "price:desc"):
+        known = [row for row in merged if row["price"] is not None]
+        unknown = [row for row in merged if row["price"] is None]
+        merged = sorted(known, key=lambda row: row["price"], reverse=sort_order == "price:desc") + unknown
+    return merged
+
+
+def search_mercari(
+        keywords: str,
+        sort_order: str = "score:desc",
+        min_price: Optional[int] = None,
+        max_price: Optional[int] = None,
+        conditions: Optional[List[str]] = None,
+        shipping_payer: Optional[str] = None,
+        keyword_variants: Optional[List[str]] = None,
+    ) -> list:
+    """
+    Synchronous function to search for items on Mercari using Playwright with Firefox.
+
+    Grid-level results are fetched once per keyword query as a larger candidate set (superset)
+    and cached; changing the sort order or adding filters is then answered locally. A live scrape
+    only runs when the cached superset cannot satisfy the request.
+
+    Keyword variants are searched concurrently with the main keywords; their results are merged,
+    de-duplicated by item ID and ranked together before any detail page is opened.
+
+    The whole search runs within `SEARCH_DEADLINE_SECONDS`, split between the grid and detail
+    stages. Transient failures are retried with jittered backoff, and a circuit breaker stops new
+    scrapes during a Mercari outage, serving stale cached results instead.
 
     Args:
         keywords (str): The search keywords to use on Mercari.
@@ -14,137 +655,69 @@ def search_mercari(keywords: str, sort_order: str = "score:desc") -> list:
                           - "price:asc" (lowest price)
                           - "price:desc" (highest price)
                           - "num_likes:desc" (most liked)
+        min_price (Optional[int]): Minimum price in yen.
+        max_price (Optional[int]): Maximum price in yen.
+        conditions (Optional[List[str]]): Accepted item conditions, e.g. ["新品、未使用", "未使用に近い"].
+        shipping_payer (Optional[str]): "seller" (送料込み) or "buyer" (着払い).
+        keyword_variants (Optional[List[str]]): Alternative keyword strings searched alongside `keywords`.
 
     Returns:
         list: A list of dictionaries containing item names, URLs, prices, descriptions, and additional details.
+
+    Raises:
+        SearchUnavailableError: If Mercari cannot be scraped and no cached results can be served.
     """
-    with sync_playwright() as playwright:
-        # Launch the Firefox browser in non-headless mode
-        browser = playwright.firefox.launch(headless=True)
-        context = browser.new_context(locale="ja-JP")
-        page = context.new_page()
-
-        # Navigate to the Mercari Japan homepage
-        page.goto("https://jp.mercari.com/")
-
-        # Find the search bar and input the keywords
-        page.get_by_role("textbox", name="検索キーワードを入力").click()
-        page.get_by_role("textbox", name="検索キーワードを入力").fill(keywords)
-        page.get_by_role("textbox", name="検索キーワードを入力").press("Enter")
-
-        # Wait for the search results to load
-        page.wait_for_selector("div#item-grid ul li[data-testid='item-cell'] img")
-
-        # Apply the "On Sale" filter
-        page.get_by_test_id("on-sale-condition-checkbox").check()
-        page.wait_for_selector("div#item-grid ul li[data-testid='item-cell'] img")
-
-        # Sort by the specified order
-        page.get_by_label("並び替えおすすめ順新しい順価格の安い順価格の高い順いいね！順").select_option(sort_order)
-        page.wait_for_selector("div#item-grid ul li[data-testid='item-cell'] img")
-
-        # Extract the first 10 items' names and URLs
-        items = []
-        item_elements = page.query_selector_all("ul li[data-testid='item-cell']")[:5]
-        for item in item_elements:
-            # Extract the item name
-            name_element = item.query_selector("span[data-testid='thumbnail-item-name']")
-            name = name_element.inner_text() if name_element else "No name"
-
-            # Extract the item URL
-            link_element = item.query_selector("a[data-testid='thumbnail-link']")
-            url = "https://jp.mercari.com" + link_element.get_attribute("href") if link_element else "No URL"
-
-            # Open the item URL in a new tab and extract additional data
-            item_data = {"name": name, "url": url}
-            if url != "No URL":
-                new_tab = context.new_page()
-                new_tab.goto(url)
-
-                try:
-                    # Check if the item is from a shop (skip if "data-testid='mercari-shops-banner-icon'" is found)
-                    shop_banner_element = new_tab.query_selector("div[data-testid='mercari-shops-banner-icon']")
-                    if shop_banner_element:
-                        print(f"Skipping shop item {name} ({url}) - Detected as Mercari Shops")
-                        new_tab.close()
-                        continue
-
-                    # Wait for the parent container to be fully loaded
-                    new_tab.wait_for_selector("div#item-info[data-testid='item-detail-container']", state="attached")
-
-                    # Wait for the price element to load
-                    print("Waiting for price element to load...")
-                    new_tab.wait_for_selector("div[data-testid='price'] span:nth-child(2)", state="visible")
-                    price_element = new_tab.query_selector("div[data-testid='price'] span:nth-child(2)") or \
-                                    new_tab.query_selector("div[data-testid='product-price'] span:nth-child(2)")
-                    item_data["price"] = price_element.inner_text() if price_element else "No price"
-
-                    # Extract the description (handle multiple patterns)
-                    print("Extracting description...")
-                    description_element = new_tab.query_selector("pre[data-testid='description']")
-                    item_data["description"] = description_element.inner_text() if description_element else "No description"
-
-                    # Extract the picture URL
-                    print("Extracting picture URL...")
-                    picture_element = new_tab.query_selector("div[data-testid='carousel-item'] img")
-                    item_data["picture"] = picture_element.get_attribute("src") if picture_element else "No picture"
-
-                    # Extract additional details (handle multiple patterns)
-                    print("Extracting additional details...")
-                    category_element = new_tab.query_selector("div[data-testid='item-detail-category']") or \
-                                       new_tab.query_selector("div[data-testid='product-detail-category']")
-                    item_data["category"] = category_element.inner_text() if category_element else "No category"
-
-                    size_element = new_tab.query_selector("span[data-testid='商品のサイズ']")
-                    item_data["size"] = size_element.inner_text() if size_element else "No size"
-
-                    condition_element = new_tab.query_selector("span[data-testid='商品の状態']")
-                    item_data["condition"] = condition_element.inner_text() if condition_element else "No condition"
-
-                    shipping_cost_element = new_tab.query_selector("span[data-testid='配送料の負担']")
-                    item_data["shipping_cost"] = shipping_cost_element.inner_text() if shipping_cost_element else "No shipping cost"
-
-                    shipping_method_element = new_tab.query_selector("span[data-testid='配送の方法']")
-                    item_data["shipping_method"] = shipping_method_element.inner_text() if shipping_method_element else "No shipping method"
-
-                    shipping_region_element = new_tab.query_selector("span[data-testid='発送元の地域']")
-                    item_data["shipping_region"] = shipping_region_element.inner_text() if shipping_region_element else "No shipping region"
-
-                    shipping_time_element = new_tab.query_selector("span[data-testid='発送までの日数']")
-                    item_data["shipping_time"] = shipping_time_element.inner_text() if shipping_time_element else "No shipping time"
-
-                    # Extract the number of likes
-                    print("Extracting number of likes...")
-                    like_element = new_tab.query_selector("div[data-testid='icon-heart-button'] span.merText.body__5616e150.inherit__5616e150")
-                    item_data["likes"] = like_element.inner_text() if like_element else "No likes"
-
-                    print(f"Extracted details: {item_data}")
-
-                except Exception as e:
-                    # Handle any errors during data extraction
-                    item_data["price"] = "No price (Error)"
-                    item_data["description"] = "No description (Error)"
-                    item_data["picture"] = "No picture (Error)"
-                    item_data["category"] = "No category (Error)"
-                    item_data["size"] = "No size (Error)"
-                    item_data["condition"] = "No condition (Error)"
-                    item_data["shipping_cost"] = "No shipping cost (Error)"
-                    item_data["shipping_method"] = "No shipping method (Error)"
-                    item_data["shipping_region"] = "No shipping region (Error)"
-                    item_data["shipping_time"] = "No shipping time (Error)"
-                    item_data["likes"] = "No likes (Error)"
-
-                # Close the tab after extracting the data
-                new_tab.close()
-
-            # Append the item details to the list
-            items.append(item_data)
-
-        # Close the browser
-        context.close()
-        browser.close()
-
-        return items
+    if sort_order not in SORT_PARAMETERS:
+        sort_order = "score:desc"
+
+    # Normalize and de-duplicate the queries, the main keywords first
+    queries = []
+    for query in [keywords, *(keyword_variants or [])]:
+        query = " ".join(query.split())
+        if query and query not in queries:
+            queries.append(query)
+    queries = queries[:MAX_QUERIES]
+
+    deadline = Deadline(SEARCH_DEADLINE_SECONDS)
+    has_filters = min_price is not None or max_price is not None or conditions or shipping_payer
+
+    try:
+        items = superset_items = None
+        if LOCAL_RERANK:
+            grid_deadline = deadline.stage(GRID_STAGE_SHARE)
+            results = _fan_out(lambda query: _superset_candidates(query, sort_order, min_price, max_price, grid_deadline), queries)
+            candidates = merge_candidates([candidates for candidates, _ in results], sort_order)
+            exhaustive = all(exhaustive for _, exhaustive in results)
+
+            with BrowserSession() as session:
+                items = collect_items(session, candidates, conditions, shipping_payer, deadline=deadline)
+
+            # Too few matches in a truncated superset: the filters need a live, Mercari-filtered listing
+            if len(items) < RESULT_SIZE and not exhaustive and has_filters and not deadline.expired():
+                superset_items, items = items, None
+
+        if items is None:
+            try:
+                grid_deadline = deadline.stage(GRID_STAGE_SHARE)
+                candidate_lists = _fan_out(
+                    lambda query: _live_candidates(query, sort_order, min_price, max_price, conditions, shipping_payer, grid_deadline),
+                    queries,
+                )
+                with BrowserSession() as session:
+                    items = collect_items(session, merge_candidates(candidate_lists, sort_order), conditions, shipping_payer, deadline=deadline)
+            except (*SCRAPE_ERRORS, SearchUnavailableError) as e:
+                # The partial superset answer is still better than an error
+                if not superset_items:
+                    raise
+                logger.warning("Live scrape failed (%s), returning %d superset item(s)", e, len(superset_items))
+                items = superset_items
+
+    except SCRAPE_ERRORS as e:
+        logger.warning("Search for %s failed: %s", queries, e)
+        raise SearchUnavailableError("メルカリの検索が一時的に利用できません。しばらくしてからもう一度お試しください。") from e
+
+    logger.info("Search for %s returned %d item(s)", queries, len(items))
+    return items
 
 
 # async def call_search_mercari(keywords: str, sort_order: str = "score:desc"):
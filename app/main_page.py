@@ -7,6 +7,9 @@ load_dotenv(dotenv_path=env_path, override=True)
 
 import asyncio
 
+from utils.logger import setup_logging
+setup_logging()
+
 from nicegui import ui, app
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import Request
@@ -15,6 +18,9 @@ from state import State
 from utils.custom_css import slide_up_bounce, message_hover_animation, pulse_custom
 from components.chat_message import Message
 from components.chat_input import ChatInput
+from utils.metrics import metrics
+from utils.thumbnails import thumbnail_response, DEFAULT_THUMB_WIDTH
+from utils.validation import resolve_client_ip
 
 # -------------------------- Middleware and Static Files -------------------------- #
 # Add CORS middleware to allow cross-origin requests
@@ -29,6 +35,28 @@ app.add_middleware(
 # Serve static files for icons
 app.add_static_files('/icon', 'icon')
 
+# -------------------------- Metrics Endpoint -------------------------- #
+@app.get('/metrics')
+async def get_metrics():
+    """
+    Returns the in-process counters, gauges and timers (e.g. validation latency, rate-limit rejections).
+    """
+    return metrics.snapshot()
+
+# -------------------------- Thumbnail Proxy -------------------------- #
+@app.get('/thumb')
+async def get_thumb(request: Request, src: str, w: int = DEFAULT_THUMB_WIDTH):
+    """
+    Serves a downscaled, re-encoded (WebP/JPEG) and disk-cached copy of a Mercari image,
+    so clients do not download full-resolution pictures for every chat card.
+    """
+    return await thumbnail_response(
+        src,
+        w,
+        accept=request.headers.get('accept', ''),
+        if_none_match=request.headers.get('if-none-match'),
+    )
+
 # -------------------------- Main Page Definition -------------------------- #
 @ui.page('/', favicon='🚀', title='FMCAIサポートデスク')
 async def page(request: Request):
@@ -82,7 +110,11 @@ async def page(request: Request):
     # -------------------------- Initialize Client-Specific State -------------------------- #
     # Create a State instance for managing OpenAI interactions and conversation history
     client_state = State(
-        openai_api_key=os.getenv("OPENAI_API_KEY")
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        client_ip=resolve_client_ip(
+            request.client.host if request.client else None,
+            request.headers.get('x-forwarded-for'),
+        )
     )
 
     # -------------------------- Header Section -------------------------- #
@@ -4,23 +4,31 @@ from zoneinfo import ZoneInfo
 
 from openai import AsyncOpenAI
 import json
+import logging
 
 from components.search_mercari import search_mercari
 from components.create_keywords import extract_keywords_and_sort_order
+from components.item_store import ItemStore
 from utils.prompt import OPENAI_CHAT_PROMPT, STREAM_RESPONSE_PROMPT
+from utils.thumbnails import thumbnail_url
+from utils.semantic_cache import question_cache
+from utils.logger import get_logger, get_hot_logger, new_correlation_id, set_correlation_ids
 
 from nicegui import run
 
 # Create a ZoneInfo object for Japan Standard Time
 japan_tz = ZoneInfo("Asia/Tokyo")
 
+logger = get_logger("state")
+stream_logger = get_hot_logger("stream")
+
 class State:
     """
     Manages the application's state, including OpenAI interactions, conversation history,
     and tool-based function calls.
     """
 
-    def __init__(self, openai_api_key: str) -> None:
+    def __init__(self, openai_api_key: str, client_ip: str = "unknown") -> None:
         # Initialize OpenAI API key and chat prompt
         self.openai_api_key = openai_api_key
         self.openai_chat_prompt = OPENAI_CHAT_PROMPT
@@ -29,6 +37,15 @@ class State:
         # As I am only have access to the OpenAI API, I will use the AsyncOpenAI client
         self.client = AsyncOpenAI(api_key=self.openai_api_key)
 
+        # Correlation ID shared by every log record of this client session
+        self.session_id = new_correlation_id()
+
+        # Client IP address, used for per-IP rate limiting
+        self.client_ip = client_ip
+
+        # Items shown in this session, used to answer follow-up questions without re-scraping
+        self.item_store = ItemStore()
+
         # Initialize conversation history with a system message (chat prompt)
         self.conversation_history = [
             {"role": "system", "content": self.openai_chat_prompt}
@@ -40,6 +57,10 @@ class State:
         Ensures that `extract_keywords_and_sort_order` is executed first, followed by `search_mercari`.
         The AI generates the final response in Markdown format.
         """
+        # Tag every log record of this turn with the session and a fresh turn ID
+        set_correlation_ids(session_id=self.session_id, turn_id=new_correlation_id())
+        logger.info("New turn (%d characters)", len(user_input))
+
         # Add user input to the conversation history
         self.conversation_history.append({"role": "user", "content": user_input})
 
@@ -94,16 +115,104 @@ class State:
                                 "- 'price:desc' (highest price)\n"
                                 "- 'num_likes:desc' (most liked)"
                             )
+                        },
+                        "keyword_variants": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": (
+                                "Optional alternative keyword strings (the `keyword_variants` output of "
+                                "`extract_keywords_and_sort_order`), searched concurrently with `keywords`."
+                            )
+                        },
+                        "min_price": {
+                            "type": "integer",
+                            "description": "Optional minimum price in yen (e.g. 3000 for '3000円以上')."
+                        },
+                        "max_price": {
+                            "type": "integer",
+                            "description": "Optional maximum price in yen (e.g. 5000 for '5000円以下')."
+                        },
+                        "conditions": {
+                            "type": "array",
+                            "items": {
+                                "type": "string",
+                                "enum": ["新品、未使用", "未使用に近い", "目立った傷や汚れなし", "やや傷や汚れあり", "傷や汚れあり", "全体的に状態が悪い"]
+                            },
+                            "description": "Optional accepted item conditions."
+                        },
+                        "shipping_payer": {
+                            "type": "string",
+                            "enum": ["seller", "buyer"],
+                            "description": "Optional shipping payer: 'seller' (送料込み) or 'buyer' (着払い)."
                         }
                     },
                     "required": ["keywords", "sort_order"],
                     "additionalProperties": False
                 }
+            },
+            {
+                "type": "function",
+                "name": "query_item_store",
+                "description": (
+                    "This function looks up items that were already shown to the user in this conversation, "
+                    "without searching Mercari again. Use it for follow-up questions about previous results, e.g. "
+                    "'2番目の商品の送料は？' (positions=[2]) or '最初の商品の説明は？' (positions=[1]). "
+                    "It can only return items already shown, so do not use it for requests that need other items, "
+                    "e.g. 'もっと安いのは？' or 'ほかにある？': call `extract_keywords_and_sort_order` and "
+                    "`search_mercari` instead (for cheaper items, with `max_price` below the prices already shown). "
+                    "If it returns no items, search Mercari as well."
+                ),
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "positions": {
+                            "type": "array",
+                            "items": {"type": "integer"},
+                            "description": "1-based positions of items in the most recent search results."
+                        },
+                        "item_ids": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "Mercari item IDs, the last part of an item URL (e.g. 'm12345678' for '/item/m12345678')."
+                        },
+                        "text": {
+                            "type": "string",
+                            "description": "Text to match against item names and descriptions."
+                        },
+                        "min_price": {
+                            "type": "integer",
+                            "description": "Minimum price in yen."
+                        },
+                        "max_price": {
+                            "type": "integer",
+                            "description": "Maximum price in yen."
+                        },
+                        "order_by": {
+                            "type": "string",
+                            "enum": ["position", "price:asc", "price:desc", "num_likes:desc"],
+                            "description": "Ordering of the returned items."
+                        }
+                    },
+                    "additionalProperties": False
+                }
             }
         ]
 
+        # Reuse the search plan of a similar earlier question, skipping the keyword extraction and
+        # tool-selection round-trips; fall back to the tool calls if the cached plan finds nothing.
+        # Only first turns are looked up: later questions may lean on earlier ones, so they still reach query_item_store.
+        items = None
+        plan = question_cache.lookup(user_input) if self.is_first_turn() else None
+        if plan is not None:
+            items = await self.call_function("search_mercari", plan)
+            self.conversation_history.append({
+                "role": "assistant",
+                "content": f"Function 'search_mercari' executed. Output: {json.dumps(items)}"
+            })
+
         # Process tool calls recursively until the final result is obtained
-        items = await self.process_tool_calls_recursively(tools)
+        if not items:
+            items = await self.process_tool_calls_recursively(tools, user_input)
 
         # If items are retrieved, pass them to the AI for final response generation
         if items:
@@ -134,7 +243,8 @@ class State:
                 if chunk.type == "response.output_text.delta":
                     streamed = True  # Mark that we have received a chunk
                     yield chunk.delta  # Yield the text content incrementally
-                    print(f"Chunk received: {chunk.delta}")  # Debugging log
+                    if stream_logger.isEnabledFor(logging.DEBUG):
+                        stream_logger.debug("Chunk received: %r", chunk.delta)
 
             # If no chunks were streamed, yield the default response
             if not streamed:
@@ -143,7 +253,7 @@ class State:
     async def call_function(self, name: str, args: dict):
         """
         Executes the specified function with the given arguments.
-        Supports 'extract_keywords_and_sort_order' and 'search_mercari'.
+        Supports 'extract_keywords_and_sort_order', 'search_mercari' and 'query_item_store'.
         """
         if name == "extract_keywords_and_sort_order":
             # Call the extract_keywords_and_sort_order function
@@ -151,9 +261,32 @@ class State:
 
         if name == "search_mercari":
             # Call the search_mercari function in a separate thread (I/O-bound)
+            # Re-sorting and price filtering are answered locally from the cached superset when possible,
+            # keyword variants are searched concurrently and merged
             keywords = args["keywords"]
             sort_order = args["sort_order"]
-            return await asyncio.to_thread(search_mercari, keywords, sort_order)
+            items = await asyncio.to_thread(
+                search_mercari,
+                keywords,
+                sort_order,
+                min_price=args.get("min_price"),
+                max_price=args.get("max_price"),
+                conditions=args.get("conditions"),
+                shipping_payer=args.get("shipping_payer"),
+                keyword_variants=args.get("keyword_variants"),
+            )
+
+            # Serve pictures through the resizing /thumb proxy instead of the full-size originals
+            for item in items:
+                item["picture"] = thumbnail_url(item.get("picture", ""))
+
+            # Remember the shown items so follow-up questions can be answered locally
+            self.item_store.add_items(items)
+            return items
+
+        if name == "query_item_store":
+            # Query previously shown items in the session's item store (no scraping)
+            return self.item_store.query(**args)
 
         return None
     
@@ -182,7 +315,7 @@ class State:
             # Return the function name and result for further processing
             yield name, result
 
-    async def process_tool_calls_recursively(self, tools):
+    async def process_tool_calls_recursively(self, tools, user_input: str):
         """
         Processes tool-based function calls recursively until no further calls are required.
         Updates the conversation history automatically after each tool call.
@@ -205,6 +338,7 @@ class State:
             args = json.loads(tool_call.arguments)
 
             # Execute the function call and get the result
+            logger.info("Calling tool %s", name)
             result = await self.call_function(name, args)
 
             # Append the tool call output to the conversation history
@@ -214,12 +348,23 @@ class State:
             })
 
             # If the result is the final recommendation, return it
-            if name == "search_mercari" and result:
+            if name in ("search_mercari", "query_item_store") and result:
+                if name == "search_mercari":
+                    # Only the first turn has no earlier context that could have shaped the plan;
+                    # the cache also checks that the question names every keyword (see `SemanticCache.put`)
+                    if self.is_first_turn():
+                        question_cache.put(user_input, args)
                 return result
 
         # If no final result is found, call the function recursively
-        return await self.process_tool_calls_recursively(tools)
+        return await self.process_tool_calls_recursively(tools, user_input)
     
+    def is_first_turn(self) -> bool:
+        """
+        Whether the current user message is the first one of the conversation.
+        """
+        return sum(message["role"] == "user" for message in self.conversation_history) == 1
+
     def get_time_stamp(self) -> str:
         # Get the current time in Japan
         now_in_japan = datetime.now(japan_tz)
@@ -0,0 +1,179 @@
+import json
+import os
+import re
+import unicodedata
+import zlib
+from typing import List, Optional
+
+import numpy as np
+
+# Number of MinHash permutations; 64 gives a Jaccard estimate within about ±0.06
+NUM_PERMUTATIONS = 64
+SHINGLE_SIZE = 3
+# Estimated Jaccard similarity of title shingles above which two listings may be duplicates
+TITLE_SIMILARITY_THRESHOLD = float(os.getenv("DEDUPE_TITLE_THRESHOLD", "0.7"))
+# Prices within this ratio (or within the absolute yen margin for cheap items) count as close
+PRICE_RATIO_TOLERANCE = 0.1
+PRICE_ABSOLUTE_TOLERANCE = 300
+
+# Prime just above 2**32, so (a * x + b) with 32-bit a, x, b never overflows uint64
+_HASH_PRIME = np.uint64(4294967311)
+_random = np.random.default_rng(seed=20250101)
+_PERMUTATION_A = _random.integers(1, 2**32, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_PERMUTATION_B = _random.integers(0, 2**32, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+# Punctuation, symbols and whitespace removed before shingling (NFKC already folds full-width forms)
+_NOISE_PATTERN = re.compile(r"[\s\W_]+")
+# "26.0cm" -> "26cm", so the decimal point does not change the shingles
+_TRAILING_ZERO_PATTERN = re.compile(r"(\d+)\.0+(?!\d)")
+
+# Size and capacity tokens. Listings that differ only in size (M vs L, 26cm vs 27cm, 128GB vs 256GB)
+# are separate offers, often at the same price, even though their titles are nearly identical.
+# Letter sizes must stand alone (or precede "サイズ") so words such as "MagSafe" do not count.
+_LETTER_SIZE_PATTERN = re.compile(
+    r"(?:^|(?<=[\s/(\[【]))(xxs|xs|s|m|l|xl|xxl|xxxl|ll|[2-4]l|[2-4]xl)(?=$|[\s/)\]】]|サイズ)"
+)
+_MEASURE_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(cm|mm|gb|tb|mb|ml|インチ|inch|号)")
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "near_duplicate_pairs.json")
+
+
+def normalize_title(title: str) -> str:
+    """
+    Normalize a listing title: NFKC (full-width to half-width), lower case, no trailing ".0" on numbers,
+    no punctuation or spaces.
+    """
+    text = _TRAILING_ZERO_PATTERN.sub(r"\1", unicodedata.normalize("NFKC", title or "").lower())
+    return _NOISE_PATTERN.sub("", text)
+
+
+def minhash_signature(title: str) -> np.ndarray:
+    """
+    Compute the MinHash signature of the character shingles of a normalized title.
+    """
+    text = normalize_title(title)
+    shingles = {text[i:i + SHINGLE_SIZE] for i in range(max(len(text) - SHINGLE_SIZE + 1, 1))}
+    hashes = np.array([zlib.crc32(shingle.encode("utf-8")) for shingle in shingles], dtype=np.uint64)
+    # One row per permutation, one column per shingle; the minimum over shingles is the signature
+    permuted = (np.outer(_PERMUTATION_A, hashes) + _PERMUTATION_B[:, None]) % _HASH_PRIME
+    return permuted.min(axis=1)
+
+
+def size_tokens(title: str) -> frozenset:
+    """
+    Extract the size and capacity tokens of a title, e.g. "... Mサイズ 128GB" -> {"m", "128gb"}.
+    """
+    text = unicodedata.normalize("NFKC", title or "").lower()
+    tokens = {match.group(1) for match in _LETTER_SIZE_PATTERN.finditer(text)}
+    # "26.0cm" and "26cm" are the same size
+    tokens.update(f"{float(number):g}{unit}" for number, unit in _MEASURE_PATTERN.findall(text))
+    return frozenset(tokens)
+
+
+def sizes_conflict(sizes_a: frozenset, sizes_b: frozenset) -> bool:
+    """
+    Whether two titles name different sizes. A title without size tokens never conflicts.
+    """
+    return bool(sizes_a) and bool(sizes_b) and sizes_a != sizes_b
+
+
+def normalize_thumbnail(url: Optional[str]) -> Optional[str]:
+    """
+    Strip the query string (cache busters, sizes) from a thumbnail URL.
+    """
+    if not url or not url.startswith("http"):
+        return None
+    return url.split("?", 1)[0]
+
+
+def prices_close(price_a: Optional[int], price_b: Optional[int]) -> bool:
+    """
+    Whether two prices are close enough for the listings to be the same offer. Unknown prices never block.
+    """
+    if price_a is None or price_b is None:
+        return True
+    margin = max(PRICE_ABSOLUTE_TOLERANCE, PRICE_RATIO_TOLERANCE * max(price_a, price_b))
+    return abs(price_a - price_b) <= margin
+
+
+class NearDuplicateIndex:
+    """
+    Index of the listings kept so far. New grid-level rows (name, price, thumbnail) are checked
+    against every kept listing in one vectorized comparison of MinHash signatures.
+    """
+
+    def __init__(self) -> None:
+        self.signatures = np.empty((0, NUM_PERMUTATIONS), dtype=np.uint64)
+        self.prices: List[Optional[int]] = []
+        self.sizes: List[frozenset] = []
+        self.thumbnails = set()
+
+    def is_duplicate(self, row: dict) -> bool:
+        """
+        Whether `row` duplicates a kept listing: same thumbnail, or similar title at a close price
+        and without a different size.
+        """
+        thumbnail = normalize_thumbnail(row.get("thumbnail"))
+        if thumbnail is not None and thumbnail in self.thumbnails:
+            return True
+        if len(self.prices) == 0:
+            return False
+
+        similarities = (self.signatures == minhash_signature(row.get("name", ""))).mean(axis=1)
+        sizes = size_tokens(row.get("name", ""))
+        return any(
+            prices_close(self.prices[index], row.get("price")) and not sizes_conflict(self.sizes[index], sizes)
+            for index in np.flatnonzero(similarities >= TITLE_SIMILARITY_THRESHOLD)
+        )
+
+    def add(self, row: dict) -> None:
+        """
+        Keep `row` as the representative of a new cluster.
+        """
+        self.signatures = np.vstack([self.signatures, minhash_signature(row.get("name", ""))])
+        self.prices.append(row.get("price"))
+        self.sizes.append(size_tokens(row.get("name", "")))
+        thumbnail = normalize_thumbnail(row.get("thumbnail"))
+        if thumbnail is not None:
+            self.thumbnails.add(thumbnail)
+
+
+def is_near_duplicate(row_a: dict, row_b: dict) -> bool:
+    """
+    Whether two grid-level rows are near-duplicate listings.
+    """
+    index = NearDuplicateIndex()
+    index.add(row_a)
+    return index.is_duplicate(row_b)
+
+
+def evaluate(pairs: List[dict]) -> dict:
+    """
+    Measure the precision and recall of `is_near_duplicate` on labelled pairs.
+
+    Args:
+        pairs (List[dict]): Items with "a" and "b" rows and a boolean "duplicate" label.
+
+    Returns:
+        dict: Counts of true/false positives and negatives, precision and recall.
+    """
+    counts = {"true_positive": 0, "false_positive": 0, "true_negative": 0, "false_negative": 0}
+    for pair in pairs:
+        predicted = is_near_duplicate(pair["a"], pair["b"])
+        key = ("true_" if predicted == pair["duplicate"] else "false_") + ("positive" if predicted else "negative")
+        counts[key] += 1
+
+    predicted_positive = counts["true_positive"] + counts["false_positive"]
+    actual_positive = counts["true_positive"] + counts["false_negative"]
+    return {
+        **counts,
+        "precision": counts["true_positive"] / predicted_positive if predicted_positive else 1.0,
+        "recall": counts["true_positive"] / actual_positive if actual_positive else 1.0,
+    }
+
+
+# Example usage: measure precision on the labelled fixture set (run from the app directory)
+#   python -m utils.dedupe
+if __name__ == "__main__":
+    with open(FIXTURE_PATH, encoding="utf-8") as fixture_file:
+        print(json.dumps(evaluate(json.load(fixture_file)), indent=2))
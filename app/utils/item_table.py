@@ -0,0 +1,153 @@
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Sort orders computed from the price column (once their listing, or every matching item, is in the table)
+PRICE_SORTS = {"price:asc", "price:desc"}
+
+# Grid-level (search result page) fields stored per item
+TEXT_COLUMNS = ["item_id", "name", "url", "thumbnail"]
+
+
+class ItemTable:
+    """
+    Columnar, numpy-backed table of the grid-level search results for one keyword query.
+
+    Holds the superset of candidates fetched from Mercari, so changing the sort order or adding a
+    price range only needs a local sort/filter over the arrays instead of a new scrape.
+    Server-side orderings (recommended, latest, most liked) are kept as rank columns, one per
+    sort order that has been fetched; price orderings are computed from the price column.
+
+    A truncated listing only holds the top items of its own order: the 40 recommended items are not
+    the 40 cheapest. So every order, price orders included, needs its own listing in the table
+    unless the table is exhaustive.
+    """
+
+    def __init__(self) -> None:
+        self.columns: Dict[str, np.ndarray] = {name: np.empty(0, dtype=object) for name in TEXT_COLUMNS}
+        self.prices = np.empty(0, dtype=np.float64)
+        self.ranks: Dict[str, np.ndarray] = {}
+        # Sort orders whose listing returned every matching item (fewer than the superset size)
+        self.exhaustive = set()
+        self.fetched_at = time.time()
+        self._positions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def merge(self, rows: List[dict], sort_order: Optional[str] = None, exhaustive: bool = False) -> None:
+        """
+        Add grid rows to the table. Items already present are kept; new items are appended.
+
+        Args:
+            rows (List[dict]): Rows with "item_id", "name", "url", "thumbnail" and "price" (int or None).
+            sort_order (Optional[str]): The order the rows were listed in. Records a rank column for it.
+            exhaustive (bool): Whether the listing contained every matching item.
+        """
+        # A listing can repeat an item (e.g. when it moves between pages while scrolling); keep its first rank
+        unique_rows: Dict[str, dict] = {}
+        for row in rows:
+            unique_rows.setdefault(row["item_id"], row)
+        rows = list(unique_rows.values())
+        new_rows = [row for row in rows if row["item_id"] not in self._positions]
+        for position, row in enumerate(new_rows, start=len(self)):
+            self._positions[row["item_id"]] = position
+
+        if new_rows:
+            for name in TEXT_COLUMNS:
+                self.columns[name] = np.concatenate([self.columns[name], np.array([row[name] for row in new_rows], dtype=object)])
+            new_prices = np.array([np.nan if row["price"] is None else row["price"] for row in new_rows], dtype=np.float64)
+            self.prices = np.concatenate([self.prices, new_prices])
+            for name, rank in self.ranks.items():
+                self.ranks[name] = np.concatenate([rank, np.full(len(new_rows), np.nan)])
+
+        if sort_order is not None:
+            rank = np.full(len(self), np.nan)
+            for position, row in enumerate(rows):
+                rank[self._positions[row["item_id"]]] = position
+            self.ranks[sort_order] = rank
+            if exhaustive:
+                self.exhaustive.add(sort_order)
+
+    def can_sort(self, sort_order: str) -> bool:
+        """
+        Whether `sort_order` can be applied locally: its listing has been fetched, or the table
+        holds every matching item.
+        """
+        return sort_order in self.ranks or self.is_exhaustive()
+
+    def is_exhaustive(self) -> bool:
+        """
+        Whether the table holds every on-sale item for its keywords.
+        """
+        return bool(self.exhaustive)
+
+    def select(self, sort_order: str, min_price: Optional[int] = None, max_price: Optional[int] = None) -> np.ndarray:
+        """
+        Filter by price range and sort locally.
+
+        Args:
+            sort_order (str): One of the Mercari sort orders. Must satisfy `can_sort`.
+            min_price (Optional[int]): Minimum price in yen.
+            max_price (Optional[int]): Maximum price in yen.
+
+        Returns:
+            np.ndarray: Row indices in the requested order.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        # NaN comparisons are False, so items with an unknown price drop out of price filters
+        if min_price is not None:
+            mask &= self.prices >= min_price
+        if max_price is not None:
+            mask &= self.prices <= max_price
+
+        if sort_order == "price:asc":
+            keys = self.prices
+        elif sort_order == "price:desc":
+            keys = -self.prices
+        else:
+            keys = self.ranks[sort_order]
+
+        indices = np.flatnonzero(mask)
+        # Unknown keys (NaN) sort last; the stable sort keeps the fetch order among ties
+        order_keys = np.where(np.isnan(keys[indices]), np.inf, keys[indices])
+        return indices[np.argsort(order_keys, kind="stable")]
+
+    def to_dict(self) -> dict:
+        """
+        Convert the table to JSON-compatible data (unknown prices and ranks become None), for shared storage.
+        """
+        def floats(values: np.ndarray) -> list:
+            return [None if np.isnan(value) else float(value) for value in values]
+
+        return {
+            "columns": {name: self.columns[name].tolist() for name in TEXT_COLUMNS},
+            "prices": floats(self.prices),
+            "ranks": {name: floats(rank) for name, rank in self.ranks.items()},
+            "exhaustive": sorted(self.exhaustive),
+            "fetched_at": self.fetched_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ItemTable":
+        """
+        Rebuild a table from `to_dict` output.
+        """
+        table = cls()
+        table.columns = {name: np.array(data["columns"][name], dtype=object) for name in TEXT_COLUMNS}
+        table.prices = np.array(data["prices"], dtype=np.float64)
+        table.ranks = {name: np.array(rank, dtype=np.float64) for name, rank in data["ranks"].items()}
+        table.exhaustive = set(data["exhaustive"])
+        table.fetched_at = data["fetched_at"]
+        table._positions = {item_id: position for position, item_id in enumerate(table.columns["item_id"])}
+        return table
+
+    def row(self, index: int) -> dict:
+        """
+        Return one row as a dictionary.
+        """
+        row = {name: self.columns[name][index] for name in TEXT_COLUMNS}
+        price = self.prices[index]
+        row["price"] = None if np.isnan(price) else int(price)
+        return row
@@ -0,0 +1,160 @@
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from typing import Optional
+
+# Correlation IDs attached to every log record.
+# `session_id` identifies one browser tab (one State instance) and `turn_id` one user message.
+session_id_var = contextvars.ContextVar("session_id", default="-")
+turn_id_var = contextvars.ContextVar("turn_id", default="-")
+
+# All application loggers live under this namespace so that NiceGUI/uvicorn logging is left untouched
+ROOT_LOGGER_NAME = "app"
+# Hot-path loggers (per-token, per-item events) live under this namespace and are sampled
+HOT_LOGGER_NAME = f"{ROOT_LOGGER_NAME}.hot"
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(session_id)s/%(turn_id)s] %(name)s: %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def new_correlation_id() -> str:
+    """
+    Create a short random ID used for sessions and turns.
+    """
+    return uuid.uuid4().hex[:8]
+
+
+def set_correlation_ids(session_id: Optional[str] = None, turn_id: Optional[str] = None) -> None:
+    """
+    Bind the session and/or turn ID to the current context.
+    `asyncio.to_thread` copies the context, so IDs also follow work moved to threads.
+    """
+    if session_id is not None:
+        session_id_var.set(session_id)
+    if turn_id is not None:
+        turn_id_var.set(turn_id)
+
+
+class CorrelationIdFilter(logging.Filter):
+    """
+    Stamp the current session and turn IDs onto the record.
+    Runs in the calling thread (before the record is queued), where the context variables are set.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.session_id = session_id_var.get()
+        record.turn_id = turn_id_var.get()
+        return True
+
+
+class HotPathFilter(logging.Filter):
+    """
+    Sample and rate-limit hot-path records.
+
+    Args:
+        sample_rate (float): Fraction of records to keep (0.0 - 1.0).
+        max_per_second (int): Upper bound of records kept per second, regardless of sampling.
+    """
+
+    def __init__(self, sample_rate: float, max_per_second: int) -> None:
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.max_per_second = max_per_second
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Warnings and errors on the hot path are never dropped
+        if record.levelno >= logging.WARNING:
+            return True
+
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start = now
+                self._window_count = 0
+            if self._window_count >= self.max_per_second:
+                return False
+            self._window_count += 1
+        return True
+
+
+def setup_logging() -> None:
+    """
+    Configure the application loggers. Safe to call more than once.
+
+    Records are pushed onto an unbounded queue by a non-blocking `QueueHandler` and written to
+    stdout by a `QueueListener` thread, so the event loop never waits on a stdout write.
+
+    Environment variables:
+        LOG_LEVEL: Level of the application loggers (default "INFO").
+        LOG_HOT_PATH_SAMPLE_RATE: Fraction of hot-path debug records kept (default "0", i.e. off).
+        LOG_HOT_PATH_MAX_PER_SECOND: Rate limit for hot-path records (default "20").
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = logging.getLevelName(os.getenv("LOG_LEVEL", "INFO").upper())
+    if not isinstance(level, int):
+        level = logging.INFO
+    sample_rate = min(max(float(os.getenv("LOG_HOT_PATH_SAMPLE_RATE", "0")), 0.0), 1.0)
+    max_per_second = int(os.getenv("LOG_HOT_PATH_MAX_PER_SECOND", "20"))
+
+    # The listener thread does the actual (blocking) write to stdout
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(CorrelationIdFilter())
+
+    root_logger = logging.getLogger(ROOT_LOGGER_NAME)
+    root_logger.setLevel(level)
+    root_logger.addHandler(queue_handler)
+    root_logger.propagate = False
+
+    # Hot-path events are debug records with their own sampled handler on the same queue.
+    # Sample rate 0 raises the level to WARNING, so `isEnabledFor(DEBUG)` short-circuits
+    # before any message formatting happens and only hot-path problems still get through
+    hot_logger = logging.getLogger(HOT_LOGGER_NAME)
+    hot_logger.propagate = False
+    if sample_rate <= 0.0:
+        hot_logger.setLevel(logging.WARNING)
+    else:
+        hot_logger.setLevel(logging.DEBUG)
+    hot_queue_handler = logging.handlers.QueueHandler(log_queue)
+    hot_queue_handler.addFilter(CorrelationIdFilter())
+    hot_queue_handler.addFilter(HotPathFilter(sample_rate, max_per_second))
+    hot_logger.addHandler(hot_queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Return an application logger, e.g. `get_logger("state")` -> "app.state".
+    """
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+
+def get_hot_logger(name: str) -> logging.Logger:
+    """
+    Return a sampled hot-path logger, e.g. `get_hot_logger("stream")` -> "app.hot.stream".
+    Guard calls with `logger.isEnabledFor(logging.DEBUG)` when building the message is costly.
+    """
+    return logging.getLogger(f"{HOT_LOGGER_NAME}.{name}")
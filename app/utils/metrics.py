@@ -0,0 +1,68 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+class Metrics:
+    """
+    Minimal in-process metrics registry with counters, gauges and timers.
+    Thread-safe, because scraping runs in worker threads.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._timers: Dict[str, Dict[str, float]] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        """
+        Increase a counter by `value`.
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """
+        Set a gauge to the current `value`.
+        """
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, seconds: float) -> None:
+        """
+        Record one duration (in seconds) for a timer.
+        """
+        with self._lock:
+            timer = self._timers.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            milliseconds = seconds * 1000
+            timer["count"] += 1
+            timer["total_ms"] += milliseconds
+            timer["max_ms"] = max(timer["max_ms"], milliseconds)
+
+    @contextmanager
+    def timed(self, name: str) -> Iterator[None]:
+        """
+        Context manager recording the duration of the block in a timer.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        """
+        Return a JSON-serializable copy of all metrics. Timers include the average in milliseconds.
+        """
+        with self._lock:
+            timers = {
+                name: {**timer, "avg_ms": timer["total_ms"] / timer["count"] if timer["count"] else 0.0}
+                for name, timer in self._timers.items()
+            }
+            return {"counters": dict(self._counters), "gauges": dict(self._gauges), "timers": timers}
+
+
+# Process-wide registry, exposed on the `/metrics` route
+metrics = Metrics()
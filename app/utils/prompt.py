@@ -27,7 +27,10 @@ EXTRACT_KEYWORDS_PROMPT = (
     "- If the user mentions '最新', '新しい', or '最近', use 'created_time:desc'.\n"
     "- If the user mentions '人気', 'おすすめ', or '評価', use 'score:desc'.\n"
     "- If the user mentions 'いいね', 'お気に入り', or '人気度', use 'num_likes:desc'.\n"
-    "Respond only in Japanese with the keywords separated by spaces and the sort order on a new line."
+    "If the request is vague or broad (e.g. '初心者向けのスノボセット'), also give up to 2 alternative keyword variants "
+    "(synonyms, broader or more specific searches, e.g. 'スノーボード セット 初心者' and 'スノボ 板 ビンディング セット').\n"
+    "Respond only in Japanese with the keywords separated by spaces on the first line, the sort order on the second line, "
+    "and each keyword variant on its own following line (omit the variants if the request is already specific)."
 )
 
 # Prompt for guiding the stream_response function
@@ -37,10 +40,13 @@ STREAM_RESPONSE_PROMPT = (
     "1. First, analyze the user's input and determine whether it requires calling tools or responding based on the conversation history.\n"
     "   - If the user asks for new recommendations or specifies new search criteria, call the `extract_keywords_and_sort_order` function first, "
     "     followed by the `search_mercari` function.\n"
-    "   - If the user asks for more details about an item already mentioned, respond based on the conversation history without calling tools.\n"
+    "   - If the user asks about items already shown (e.g., '2番目の商品の送料は？', '最初の商品の状態は？'), call the `query_item_store` function "
+    "     to look them up locally. Search Mercari again if it returns no items or the question needs new data.\n"
+    "   - Requests for other items than the ones shown (e.g., 'もっと安いのは？', 'ほかにある？') need new data: call "
+    "     `extract_keywords_and_sort_order` and `search_mercari` again, for cheaper items with `max_price` below the prices already shown.\n"
     "   - If the user asks a follow-up question unrelated to item recommendations, respond politely and appropriately without calling tools.\n"
     "2. Use the following rules to decide:\n"
-    "   - If the input contains phrases like 'もっと詳しく', '最初の商品', or 'この商品について', it likely refers to an item already mentioned.\n"
+    "   - If the input contains phrases like 'もっと詳しく', '最初の商品', 'この商品について', or '2番目', it likely refers to an item already mentioned.\n"
     "   - If the input contains new search criteria or keywords, call the tools to perform a new search.\n"
     "3. When calling tools, ensure that `extract_keywords_and_sort_order` is executed first to extract keywords and determine the sort order. "
     "   Use the output of this function as input for the `search_mercari` function.\n"
@@ -0,0 +1,175 @@
+import random
+import threading
+import time
+from typing import Callable, Optional, Tuple, Type, TypeVar
+
+from utils.logger import get_logger
+from utils.metrics import metrics
+
+logger = get_logger("resilience")
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when an operation runs out of its time budget.
+    """
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised when a circuit breaker rejects a call because the dependency is considered down.
+    """
+
+
+class Deadline:
+    """
+    A time budget shared by the stages of one operation.
+
+    Args:
+        seconds (float): Total budget in seconds, starting now.
+    """
+
+    def __init__(self, seconds: float) -> None:
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """
+        Seconds left (never negative).
+        """
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def timeout_ms(self) -> float:
+        """
+        Remaining time in milliseconds, for Playwright `timeout=` arguments.
+        Raises `DeadlineExceeded` if nothing is left, so no call is started without a budget.
+        """
+        remaining = self.remaining()
+        if remaining <= 0.0:
+            raise DeadlineExceeded(f"Deadline of {self.seconds:.1f}s exceeded")
+        return remaining * 1000
+
+    def stage(self, share: float, max_seconds: Optional[float] = None) -> "Deadline":
+        """
+        Create a sub-deadline for one stage: `share` of the total budget, capped by what is left
+        (and by `max_seconds` if given).
+        """
+        seconds = min(self.seconds * share, self.remaining())
+        if max_seconds is not None:
+            seconds = min(seconds, max_seconds)
+        return Deadline(seconds)
+
+
+def retry(
+        function: Callable[[], T],
+        attempts: int,
+        retry_on: Tuple[Type[BaseException], ...],
+        deadline: Optional[Deadline] = None,
+        base_delay: float = 0.5,
+        max_delay: float = 4.0,
+        min_attempt_seconds: float = 0.0,
+    ) -> T:
+    """
+    Call `function` up to `attempts` times, retrying on `retry_on` exceptions with exponential
+    backoff and full jitter. No retry is started if the backoff, plus `min_attempt_seconds` for
+    the attempt itself, would not fit in the deadline.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return function()
+        except retry_on as e:
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+            if attempt == attempts or (deadline is not None and deadline.remaining() <= delay + min_attempt_seconds):
+                raise
+            logger.warning("Attempt %d/%d failed (%s), retrying in %.2fs", attempt, attempts, e, delay)
+            metrics.incr("retry.attempts")
+            time.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing dependency.
+
+    After `failure_threshold` consecutive failures the breaker opens and rejects calls for
+    `reset_timeout` seconds. Then it is half-open: one trial call is let through, and its outcome
+    closes or re-opens the breaker. The state is published as the gauge
+    `circuit_breaker.<name>.state` (0 closed, 1 half-open, 2 open).
+
+    Args:
+        name (str): Name used in logs and metrics.
+        failure_threshold (int): Consecutive failures that open the breaker.
+        reset_timeout (float): Seconds the breaker stays open before a trial call.
+    """
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        self._set_state(self.CLOSED)
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning("Circuit breaker '%s': %s -> %s", self.name, self.state, state)
+            metrics.incr(f"circuit_breaker.{self.name}.to_{state}")
+        self.state = state
+        metrics.set_gauge(f"circuit_breaker.{self.name}.state", self._STATE_VALUES[state])
+
+    def allow(self) -> bool:
+        """
+        Whether a call may go ahead. In the half-open state only one trial call is allowed at a time.
+        """
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            metrics.incr(f"circuit_breaker.{self.name}.rejected")
+            return False
+
+    def check(self) -> None:
+        """
+        Raise `CircuitOpenError` if a call may not go ahead.
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit breaker '{self.name}' is open")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+            self._set_state(self.CLOSED)
+
+    def record_cancelled(self) -> None:
+        """
+        Record a call that ended before reaching the dependency (e.g. our own deadline ran out).
+        It counts as neither success nor failure, but frees the half-open trial slot.
+        """
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(self.OPEN)
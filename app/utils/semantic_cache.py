@@ -0,0 +1,291 @@
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from typing import List, Optional
+
+import numpy as np
+
+from utils.logger import get_logger
+from utils.metrics import metrics
+
+logger = get_logger("semantic_cache")
+
+# Dimension of the hashed n-gram vectors; collisions are rare enough for short questions
+VECTOR_DIMENSION = 2048
+NGRAM_SIZES = (2, 3)
+# Tuned on fixtures/question_pairs.json and checked on fixtures/question_pairs_holdout.json
+# (`python -m utils.semantic_cache`): rewordings normalize to the same content (1.0), while one extra
+# qualifier ("スイッチ" vs "スイッチ ライト") still scores about 0.86
+SIMILARITY_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_CAPACITY = int(os.getenv("SEMANTIC_CACHE_CAPACITY", "1000"))
+# Questions this similar to a cached one replace its entry instead of taking a new slot
+DUPLICATE_THRESHOLD = 0.98
+
+# Labelled pairs the threshold is tuned on, and held-out pairs (other products and wordings) it is checked on
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "question_pairs.json")
+HOLDOUT_FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "question_pairs_holdout.json")
+# Plan arguments that narrow a search beyond its keywords and sort order
+FILTER_ARGUMENTS = ("min_price", "max_price", "conditions", "shipping_payer")
+
+# Punctuation, symbols and whitespace carry no meaning for matching
+_NOISE_PATTERN = re.compile(r"[\s\W_]+")
+# Numbers (prices, sizes) change the plan, but barely change n-gram similarity
+_DIGIT_PATTERN = re.compile(r"\d")
+
+# Sort-order wording, rewritten to the canonical words of SORT_CUES (in order) before matching;
+# "recommended" wording is dropped, as recommended is the default order. Product names and their
+# spelling variants are deliberately not listed: such rules would only cover the products someone
+# thought of, and would be tuned on the same questions the threshold is measured on.
+SYNONYMS = [
+    (re.compile(r"お?手頃|格安|安価|低価格|プチプラ|リーズナブル|安く|安め"), "安い"),
+    (re.compile(r"高価格|高価|高級"), "高い"),
+    (re.compile(r"新着|最近|新しい"), "最新"),
+    (re.compile(r"人気度|いいね数|お気に入り"), "いいね"),
+    (re.compile(r"おすすめ|オススメ|人気|評価"), ""),
+]
+# Canonical words deciding the sort order (see EXTRACT_KEYWORDS_PROMPT). They are short, so n-gram
+# similarity barely notices them ("安い" vs "高い"); they are matched exactly instead of vectorized.
+SORT_CUES = {
+    "price:asc": "安い",
+    "price:desc": "高い",
+    "created_time:desc": "最新",
+    "num_likes:desc": "いいね",
+}
+_SORT_CUE_PATTERN = re.compile("|".join(SORT_CUES.values()))
+# Request phrasing that says nothing about what to search for
+_FILLER_PATTERN = re.compile(
+    r"(メルカリで|メルカリの|を?探しています|を?探してる|はありますか|ありますか|ありませんか|が?欲しいです|が?欲しい|が?ほしい|"
+    r"を?教えてください|を?教えて|を?ください|お願いします|が多い|なもの|のもの|もの)"
+)
+# Single particles left between (or after) content words, e.g. "ワンピースの全巻" or "ウェアで"
+_PARTICLE_PATTERN = re.compile(r"(?<![ぁ-ん])[のでをがはなにと](?![ぁ-ん])")
+
+
+def canonicalize(text: str) -> str:
+    """
+    NFKC-normalize, lower-case and rewrite spelling variants and synonyms to their canonical form.
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    for pattern, replacement in SYNONYMS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def normalize_question(text: str) -> str:
+    """
+    The searchable content of a question: canonicalized, without sort-order words, filler phrases,
+    particles, punctuation and whitespace.
+    """
+    text = _SORT_CUE_PATTERN.sub(" ", canonicalize(text))
+    text = _FILLER_PATTERN.sub(" ", text)
+    # Removing a word can leave a particle stranded next to another one, so strip them per chunk
+    text = " ".join(_PARTICLE_PATTERN.sub("", chunk) for chunk in text.split())
+    return _NOISE_PATTERN.sub("", text)
+
+
+def sort_cues(text: str) -> frozenset:
+    """
+    The sort orders hinted at by the question's wording.
+    """
+    text = canonicalize(text)
+    return frozenset(name for name, word in SORT_CUES.items() if word in text)
+
+
+def is_self_contained(question: str, keywords: str) -> bool:
+    """
+    Whether a question names everything its plan searches for, i.e. every one of the plan's
+    `keywords` appears in it. Follow-ups such as 'もっと安いのは？' or 'メンズは？' are resolved from
+    the conversation, so a plan resolved for them is not valid for the same words in another
+    conversation (and vice versa).
+    """
+    normalized = normalize_question(question)
+    keywords = [keyword for keyword in map(normalize_question, keywords.split()) if keyword]
+    return bool(keywords) and all(keyword in normalized for keyword in keywords)
+
+
+def has_filters(plan: dict) -> bool:
+    """
+    Whether a plan uses price, condition or shipping filters. Prices can only come from numbers
+    (which are never cached, see `is_cacheable`) or from the conversation, and the filters are not
+    part of the similarity, so such plans are not cached.
+    """
+    return any(plan.get(name) for name in FILTER_ARGUMENTS)
+
+
+def vectorize(text: str) -> np.ndarray:
+    """
+    Hash the character n-grams of a question into an L2-normalized vector (hashing trick, no vocabulary).
+    """
+    text = normalize_question(text)
+    vector = np.zeros(VECTOR_DIMENSION, dtype=np.float32)
+    for size in NGRAM_SIZES:
+        for i in range(len(text) - size + 1):
+            hashed = zlib.crc32(text[i:i + size].encode("utf-8"))
+            # The top bit picks a sign, so colliding n-grams tend to cancel out instead of adding up
+            vector[hashed % VECTOR_DIMENSION] += 1.0 if hashed & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def is_cacheable(question: str) -> bool:
+    """
+    Whether a question may be looked up or stored. Questions with numbers are not cached, because
+    "3000円以下" and "5000円以下" are near-identical n-gram-wise but need different plans.
+    """
+    return bool(normalize_question(question)) and not _DIGIT_PATTERN.search(unicodedata.normalize("NFKC", question))
+
+
+class SemanticCache:
+    """
+    Maps user questions to previously resolved search plans (`search_mercari` arguments) by
+    cosine similarity of character n-gram hashing vectors, using a brute-force nearest-neighbour
+    search over a preallocated matrix. A hit also requires the same sort cues (see `sort_cues`).
+    The least recently used entry is evicted when full.
+
+    Matching is lexical: rewordings are caught by the sort-word rules and filler/particle removal in
+    `normalize_question`, not by meaning. Other synonyms and spelling variants ("スノボ" vs
+    "スノーボード") do not match.
+
+    Args:
+        capacity (int): Maximum number of cached questions.
+        threshold (float): Minimum cosine similarity for a hit.
+    """
+
+    def __init__(self, capacity: int, threshold: float) -> None:
+        self.capacity = capacity
+        self.threshold = threshold
+        self.vectors = np.zeros((capacity, VECTOR_DIMENSION), dtype=np.float32)
+        self.questions: List[Optional[str]] = [None] * capacity
+        self.cues: List[frozenset] = [frozenset()] * capacity
+        self.plans: List[Optional[dict]] = [None] * capacity
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _nearest(self, vector: np.ndarray, cues: frozenset):
+        # Vectors are normalized, so the dot product is the cosine similarity
+        similarities = self.vectors[:self.size] @ vector
+        for index in np.argsort(-similarities):
+            if similarities[index] < self.threshold:
+                break
+            if self.cues[index] == cues:
+                return int(index), float(similarities[index])
+        return None, 0.0
+
+    def _record_lookup(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        metrics.incr(f"semantic_cache.{'hit' if hit else 'miss'}")
+        metrics.set_gauge("semantic_cache.hit_rate", self.hits / (self.hits + self.misses))
+
+    def lookup(self, question: str) -> Optional[dict]:
+        """
+        Return the plan of the most similar cached question, or None if none passes the threshold.
+        A plan is only returned if the question is self-contained for it (see `is_self_contained`),
+        so follow-up questions always go through tool selection.
+        """
+        if not is_cacheable(question):
+            return None
+
+        vector = vectorize(question)
+        with self._lock, metrics.timed("semantic_cache.lookup"):
+            index, similarity = self._nearest(vector, sort_cues(question))
+            if index is not None and not is_self_contained(question, self.plans[index].get("keywords", "")):
+                index = None
+            if index is None:
+                self._record_lookup(False)
+                return None
+            self.last_used[index] = time.monotonic()
+            self._record_lookup(True)
+            logger.info("Semantic cache hit (%.2f): '%s' ~ '%s'", similarity, question, self.questions[index])
+            return dict(self.plans[index])
+
+    def put(self, question: str, plan: dict) -> None:
+        """
+        Cache the plan resolved for a question. Plans with filters, and questions that are not
+        self-contained for their plan, are skipped.
+        """
+        if not is_cacheable(question) or has_filters(plan) or not is_self_contained(question, plan.get("keywords", "")):
+            return
+
+        vector = vectorize(question)
+        cues = sort_cues(question)
+        with self._lock:
+            index, similarity = self._nearest(vector, cues)
+            if similarity < DUPLICATE_THRESHOLD:
+                index = None
+            if index is None:
+                if self.size < self.capacity:
+                    index = self.size
+                    self.size += 1
+                else:
+                    index = int(np.argmin(self.last_used))
+                    metrics.incr("semantic_cache.evicted")
+
+            self.vectors[index] = vector
+            self.questions[index] = question
+            self.cues[index] = cues
+            self.plans[index] = dict(plan)
+            self.last_used[index] = time.monotonic()
+            metrics.set_gauge("semantic_cache.size", self.size)
+
+
+# Process-wide cache shared by all sessions
+question_cache = SemanticCache(SEMANTIC_CACHE_CAPACITY, SIMILARITY_THRESHOLD)
+
+
+def is_same_question(question_a: str, question_b: str, threshold: float = SIMILARITY_THRESHOLD) -> bool:
+    """
+    Whether the cache would serve `question_b` with the plan cached for `question_a`.
+    """
+    similarity = float(vectorize(question_a) @ vectorize(question_b))
+    return similarity >= threshold and sort_cues(question_a) == sort_cues(question_b)
+
+
+def evaluate(pairs: List[dict], threshold: float = SIMILARITY_THRESHOLD) -> dict:
+    """
+    Measure the precision and recall of `is_same_question` on labelled question pairs.
+
+    Args:
+        pairs (List[dict]): Items with "a" and "b" questions and a boolean "same" label
+            (whether the same search plan answers both).
+        threshold (float): Similarity threshold to evaluate.
+
+    Returns:
+        dict: Counts of true/false positives and negatives, precision and recall.
+    """
+    counts = {"true_positive": 0, "false_positive": 0, "true_negative": 0, "false_negative": 0}
+    for pair in pairs:
+        predicted = is_same_question(pair["a"], pair["b"], threshold)
+        key = ("true_" if predicted == pair["same"] else "false_") + ("positive" if predicted else "negative")
+        counts[key] += 1
+
+    predicted_positive = counts["true_positive"] + counts["false_positive"]
+    actual_positive = counts["true_positive"] + counts["false_negative"]
+    return {
+        **counts,
+        "precision": counts["true_positive"] / predicted_positive if predicted_positive else 1.0,
+        "recall": counts["true_positive"] / actual_positive if actual_positive else 1.0,
+    }
+
+
+# Example usage: precision and recall per threshold on the tuning and held-out sets (run from the app directory)
+#   python -m utils.semantic_cache
+if __name__ == "__main__":
+    with open(FIXTURE_PATH, encoding="utf-8") as fixture_file:
+        fixture_pairs = json.load(fixture_file)
+    with open(HOLDOUT_FIXTURE_PATH, encoding="utf-8") as fixture_file:
+        holdout_pairs = json.load(fixture_file)
+    for candidate in (0.7, 0.8, 0.85, 0.9, SIMILARITY_THRESHOLD, 0.95, 1.0):
+        result = evaluate(fixture_pairs, candidate)
+        holdout = evaluate(holdout_pairs, candidate)
+        print(f"threshold {candidate:.2f}: precision {result['precision']:.2f}, recall {result['recall']:.2f} "
+              f"(held out: precision {holdout['precision']:.2f}, recall {holdout['recall']:.2f})")
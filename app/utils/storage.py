@@ -0,0 +1,486 @@
+import json
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import unquote, urlparse
+
+from utils.logger import get_logger
+from utils.metrics import metrics
+
+logger = get_logger("storage")
+
+# "memory" (per process), "sqlite:///path/to/cache.db" or "redis://[:password@]host:port[/db]"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "memory")
+# Prepended to every key, so several deployments can share one Redis database
+STORAGE_KEY_PREFIX = os.getenv("STORAGE_KEY_PREFIX", "chat_with_mercari:")
+# Bounds of the in-memory backend: cached values (supersets, item details) and counters (rate limits)
+MEMORY_MAX_ENTRIES = int(os.getenv("STORAGE_MEMORY_MAX_ENTRIES", "5000"))
+MEMORY_MAX_COUNTERS = int(os.getenv("STORAGE_MEMORY_MAX_COUNTERS", "100000"))
+REDIS_TIMEOUT_SECONDS = float(os.getenv("STORAGE_REDIS_TIMEOUT_SECONDS", "2"))
+# After a failed connection, calls fail fast for this long instead of each waiting for the timeout
+REDIS_RETRY_COOLDOWN_SECONDS = float(os.getenv("STORAGE_REDIS_RETRY_COOLDOWN_SECONDS", "5"))
+
+# Values are JSON; larger ones are zlib-compressed. The first byte of a stored value says which.
+FORMAT_JSON = 0
+FORMAT_ZLIB_JSON = 1
+COMPRESS_MIN_BYTES = 256
+COMPRESS_LEVEL = 6
+
+
+class StorageError(RuntimeError):
+    """
+    Raised when the storage backend cannot be reached or returns an error.
+    """
+
+
+def encode(value: Any) -> bytes:
+    """
+    Serialize a JSON-compatible value into a compact binary form: a 1-byte format header
+    followed by compact UTF-8 JSON, zlib-compressed when it is at least `COMPRESS_MIN_BYTES` long.
+    """
+    data = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(data) >= COMPRESS_MIN_BYTES:
+        return bytes([FORMAT_ZLIB_JSON]) + zlib.compress(data, COMPRESS_LEVEL)
+    return bytes([FORMAT_JSON]) + data
+
+
+def decode(data: bytes) -> Any:
+    """
+    Inverse of `encode`. Raises `StorageError` for corrupt or foreign data.
+    """
+    try:
+        header, payload = data[0], data[1:]
+        if header == FORMAT_ZLIB_JSON:
+            payload = zlib.decompress(payload)
+        elif header != FORMAT_JSON:
+            raise StorageError(f"Unknown value format {header}")
+        return json.loads(payload)
+    except (IndexError, zlib.error, ValueError) as e:
+        raise StorageError(f"Corrupt stored value: {e}") from e
+
+
+class StorageBackend:
+    """
+    Key-value storage for data shared between requests (and, with the SQLite and Redis backends,
+    between replicas). Values are JSON-compatible and stored in the `encode` format; `ttl` is in
+    seconds, None meaning no expiry. Counters (`incr`) are separate from values and only read through `incr`.
+
+    Subclasses implement `get_many`, `set_many`, `delete` and `incr`.
+    """
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key]).get(key)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.set_many({key: value}, ttl)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Read several keys in one round trip. Missing and expired keys are left out of the result.
+        """
+        raise NotImplementedError
+
+    def set_many(self, values: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        """
+        Write several keys in one round trip.
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """
+        Atomically add `amount` to a counter and return the new value. `ttl` is set when the
+        counter is created, so a counter restarts from zero once it expires.
+        """
+        raise NotImplementedError
+
+
+class MemoryBackend(StorageBackend):
+    """
+    Process-local storage (the default). Nothing is shared between replicas.
+
+    Cached values and counters are kept in separate stores with their own bounds, so churn in the
+    caches never evicts a rate-limit counter (which would reset that user's limit), and many
+    sessions' counters never evict cached search data.
+
+    Args:
+        max_entries (int): Maximum number of cached values; the least recently used are evicted first.
+        max_counters (int): Maximum number of live counters; expired counters are dropped first.
+    """
+
+    def __init__(self, max_entries: int = MEMORY_MAX_ENTRIES, max_counters: int = MEMORY_MAX_COUNTERS) -> None:
+        self.max_entries = max_entries
+        self.max_counters = max_counters
+        # key -> (expires_at, encoded value) and key -> (expires_at, count)
+        self._values: Dict[str, tuple] = {}
+        self._counters: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _lookup(entries: Dict[str, tuple], key: str, now: float) -> Optional[tuple]:
+        entry = entries.pop(key, None)
+        if entry is None or entry[0] <= now:
+            return None
+        # Re-insert so the entry moves to the end of the eviction order
+        entries[key] = entry
+        return entry
+
+    @staticmethod
+    def _store(entries: Dict[str, tuple], key: str, entry: tuple, max_entries: int, kind: str) -> None:
+        entries.pop(key, None)
+        entries[key] = entry
+        if len(entries) > max_entries:
+            # Expired entries go first, so live ones are only evicted when the bound is really reached
+            now = time.time()
+            for expired in [key for key, (expires_at, _) in entries.items() if expires_at <= now]:
+                del entries[expired]
+        # Dictionaries keep insertion order, so the first key is the least recently used
+        while len(entries) > max_entries:
+            del entries[next(iter(entries))]
+            metrics.incr(f"storage.evicted.{kind}")
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            entries = {key: self._lookup(self._values, key, now) for key in keys}
+        return {key: decode(entry[1]) for key, entry in entries.items() if entry is not None}
+
+    def set_many(self, values: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else math.inf
+        encoded = {key: encode(value) for key, value in values.items()}
+        with self._lock:
+            for key, data in encoded.items():
+                self._store(self._values, key, (expires_at, data), self.max_entries, "value")
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._values.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = time.time()
+        with self._lock:
+            entry = self._lookup(self._counters, key, now)
+            if entry is None:
+                entry = (now + ttl if ttl is not None else math.inf, 0)
+            entry = (entry[0], entry[1] + amount)
+            self._store(self._counters, key, entry, self.max_counters, "counter")
+            return entry[1]
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Storage in an SQLite file, shared by all processes on the same host (WAL mode, so readers
+    do not block the writer). Each thread uses its own connection. The file is only opened on
+    first use, so an unusable path surfaces as `StorageError` from the calls, not from the constructor.
+
+    Args:
+        path (str): Database file path, created if missing.
+    """
+
+    # Expired rows are deleted every this many writes
+    PURGE_INTERVAL = 500
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            try:
+                connection = sqlite3.connect(self.path, timeout=5.0)
+            except sqlite3.Error as e:
+                raise StorageError(f"SQLite open failed: {e}") from e
+            try:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA synchronous=NORMAL")
+                with connection:
+                    connection.execute(
+                        "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+                    )
+                    connection.execute(
+                        "CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires_at REAL)"
+                    )
+            except sqlite3.Error as e:
+                connection.close()
+                raise StorageError(f"SQLite open failed: {e}") from e
+            self._local.connection = connection
+        return connection
+
+    def _purge(self, connection: sqlite3.Connection, now: float) -> None:
+        self._writes += 1
+        if self._writes % self.PURGE_INTERVAL == 0:
+            connection.execute("DELETE FROM kv WHERE expires_at <= ?", (now,))
+            connection.execute("DELETE FROM counters WHERE expires_at <= ?", (now,))
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        try:
+            rows = self._connection().execute(
+                f"SELECT key, value FROM kv WHERE key IN ({','.join('?' * len(keys))})"
+                " AND (expires_at IS NULL OR expires_at > ?)",
+                (*keys, time.time()),
+            ).fetchall()
+        except sqlite3.Error as e:
+            raise StorageError(f"SQLite read failed: {e}") from e
+        return {key: decode(value) for key, value in rows}
+
+    def set_many(self, values: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        rows = [(key, encode(value), expires_at) for key, value in values.items()]
+        try:
+            with self._connection() as connection:
+                connection.executemany("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)", rows)
+                self._purge(connection, now)
+        except sqlite3.Error as e:
+            raise StorageError(f"SQLite write failed: {e}") from e
+
+    def delete(self, key: str) -> None:
+        try:
+            with self._connection() as connection:
+                connection.execute("DELETE FROM kv WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            raise StorageError(f"SQLite write failed: {e}") from e
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        try:
+            with self._connection() as connection:
+                # An expired counter restarts from `amount` with a new expiry
+                (value,) = connection.execute(
+                    "INSERT INTO counters (key, value, expires_at) VALUES (?, ?, ?)"
+                    " ON CONFLICT(key) DO UPDATE SET"
+                    " value = CASE WHEN expires_at <= ? THEN excluded.value ELSE value + excluded.value END,"
+                    " expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END"
+                    " RETURNING value",
+                    (key, amount, expires_at, now, now),
+                ).fetchone()
+                self._purge(connection, now)
+        except sqlite3.Error as e:
+            raise StorageError(f"SQLite write failed: {e}") from e
+        return value
+
+
+class RedisBackend(StorageBackend):
+    """
+    Storage in Redis (or any server speaking the Redis protocol, e.g. Valkey, KeyDB or a local
+    stand-in), shared by all replicas. Uses a minimal RESP client over one socket, so no client
+    library is needed; batched calls are sent as a pipeline in a single write.
+
+    If the server cannot be reached, calls fail fast with `StorageError` for
+    `REDIS_RETRY_COOLDOWN_SECONDS`, so an unreachable host does not add a connect timeout to every request.
+
+    Args:
+        host (str): Server host.
+        port (int): Server port.
+        db (int): Database number (SELECT).
+        password (Optional[str]): Password (AUTH), if the server requires one.
+    """
+
+    def __init__(self, host: str, port: int, db: int = 0, password: Optional[str] = None) -> None:
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self._socket: Optional[socket.socket] = None
+        self._reader = None
+        self._lock = threading.Lock()
+        self._unavailable_until = 0.0
+
+    def _connect(self) -> None:
+        self._socket = socket.create_connection((self.host, self.port), timeout=REDIS_TIMEOUT_SECONDS)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._socket.makefile("rb")
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            try:
+                self._send(setup)
+            except StorageError:
+                self._close()
+                raise
+
+    def _close(self) -> None:
+        if self._socket is not None:
+            self._socket.close()
+        self._socket = self._reader = None
+
+    @staticmethod
+    def _pack(command: tuple) -> bytes:
+        parts = [b"*%d\r\n" % len(command)]
+        for argument in command:
+            if not isinstance(argument, bytes):
+                argument = str(argument).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(argument), argument))
+        return b"".join(parts)
+
+    def _read_reply(self) -> Any:
+        line = self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by the Redis server")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode("utf-8")
+        if kind == b"-":
+            # Returned (not raised) so the rest of a pipeline's replies are still read
+            return StorageError(body.decode("utf-8"))
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            return None if length < 0 else self._reader.read(length + 2)[:-2]
+        if kind == b"*":
+            length = int(body)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise StorageError(f"Unexpected Redis reply: {line!r}")
+
+    def _send(self, commands: List[tuple]) -> list:
+        self._socket.sendall(b"".join(self._pack(command) for command in commands))
+        replies = [self._read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, StorageError):
+                raise reply
+        return replies
+
+    def execute(self, *commands: tuple) -> list:
+        """
+        Send commands as one pipeline and return their replies. Reconnects once if an open connection
+        was lost; a failed new connection starts the cooldown.
+        """
+        with self._lock:
+            if time.monotonic() < self._unavailable_until:
+                metrics.incr("storage.redis.cooldown_rejected")
+                raise StorageError("Redis unavailable, waiting before reconnecting")
+            for attempt in range(2):
+                reused = self._socket is not None
+                try:
+                    if not reused:
+                        self._connect()
+                    return self._send(list(commands))
+                except OSError as e:
+                    # A broken connection may hold unread replies, so it is never reused
+                    self._close()
+                    if not reused or attempt == 1:
+                        self._unavailable_until = time.monotonic() + REDIS_RETRY_COOLDOWN_SECONDS
+                        logger.warning("Redis connection failed, retrying in %.0fs: %s", REDIS_RETRY_COOLDOWN_SECONDS, e)
+                        raise StorageError(f"Redis connection failed: {e}") from e
+        raise AssertionError("unreachable")
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        (values,) = self.execute(("MGET", *keys))
+        return {key: decode(value) for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, values: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        if not values:
+            return
+        expiry = ("PX", max(int(ttl * 1000), 1)) if ttl is not None else ()
+        self.execute(*(("SET", key, encode(value), *expiry) for key, value in values.items()))
+
+    def delete(self, key: str) -> None:
+        self.execute(("DEL", key))
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        if ttl is None:
+            (value,) = self.execute(("INCRBY", key, amount))
+            return value
+        # Create the counter with its expiry first (NX: only if missing), then increment it
+        _, value = self.execute(("SET", key, 0, "PX", max(int(ttl * 1000), 1), "NX"), ("INCRBY", key, amount))
+        return value
+
+
+class PrefixedStorage(StorageBackend):
+    """
+    Namespaces all keys of a backend with a prefix and records latency and error metrics.
+    """
+
+    def __init__(self, backend: StorageBackend, prefix: str) -> None:
+        self.backend = backend
+        self.prefix = prefix
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        with metrics.timed("storage.get_many"):
+            values = self.backend.get_many([self.prefix + key for key in keys])
+        found = {key: values[self.prefix + key] for key in keys if self.prefix + key in values}
+        metrics.incr("storage.hit", len(found))
+        metrics.incr("storage.miss", len(keys) - len(found))
+        return found
+
+    def set_many(self, values: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        with metrics.timed("storage.set_many"):
+            self.backend.set_many({self.prefix + key: value for key, value in values.items()}, ttl)
+
+    def delete(self, key: str) -> None:
+        self.backend.delete(self.prefix + key)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        with metrics.timed("storage.incr"):
+            return self.backend.incr(self.prefix + key, amount, ttl)
+
+
+def create_backend(url: str) -> StorageBackend:
+    """
+    Create a backend from a `STORAGE_BACKEND` value: "memory", "sqlite:///path" or "redis://host:port/db".
+    """
+    if url == "memory":
+        return MemoryBackend()
+
+    parsed = urlparse(url)
+    if parsed.scheme == "sqlite":
+        # sqlite:///relative.db and sqlite:////absolute/path.db, as in SQLAlchemy URLs
+        return SQLiteBackend(parsed.path[1:] or "storage.db")
+    if parsed.scheme == "redis":
+        return RedisBackend(
+            parsed.hostname or "localhost",
+            parsed.port or 6379,
+            db=int(parsed.path.strip("/") or 0),
+            password=unquote(parsed.password) if parsed.password else None,
+        )
+    raise ValueError(f"Unsupported STORAGE_BACKEND: {url}")
+
+
+_storage: Optional[StorageBackend] = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> StorageBackend:
+    """
+    Return the process-wide storage configured by `STORAGE_BACKEND`, creating it on first use.
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = PrefixedStorage(create_backend(STORAGE_BACKEND), STORAGE_KEY_PREFIX)
+            logger.info("Using %s storage", type(_storage.backend).__name__)
+        return _storage
+
+
+# Example usage: check the configured backend (run from the app directory), e.g.
+#   STORAGE_BACKEND=redis://localhost:6379 python -m utils.storage
+if __name__ == "__main__":
+    storage = get_storage()
+    value = {"name": "スノーボードウェア", "prices": list(range(100))}
+    storage.set_many({"check:a": value, "check:b": value}, ttl=10)
+    assert storage.get_many(["check:a", "check:b", "check:missing"]) == {"check:a": value, "check:b": value}
+    assert storage.incr("check:counter", ttl=10) + 1 == storage.incr("check:counter", ttl=10)
+    storage.delete("check:a")
+    assert storage.get("check:a") is None
+    print(f"{type(storage.backend).__name__} OK ({len(encode(value))} bytes encoded, {len(json.dumps(value))} as JSON)")
@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import os
+import threading
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote, urlparse
+
+import httpx
+from fastapi import HTTPException, Response
+from PIL import Image, UnidentifiedImageError
+
+from utils.logger import get_logger
+from utils.metrics import metrics
+
+logger = get_logger("thumbnails")
+
+# Only Mercari's image CDN may be proxied, so /thumb cannot be used to fetch arbitrary URLs
+ALLOWED_HOST_SUFFIXES = tuple(os.getenv("THUMB_ALLOWED_HOSTS", "mercdn.net").split(","))
+# Allowed output widths; a fixed set keeps the number of cached variants per image small
+THUMB_WIDTHS = (100, 200, 400)
+DEFAULT_THUMB_WIDTH = 200
+THUMB_QUALITY = 75
+THUMB_CACHE_DIR = os.getenv("THUMB_CACHE_DIR", os.path.join(os.path.dirname(__file__), "..", ".thumb_cache"))
+THUMB_CACHE_MAX_BYTES = int(os.getenv("THUMB_CACHE_MAX_MB", "200")) * 1024 * 1024
+THUMB_FETCH_TIMEOUT_SECONDS = 10
+MAX_SOURCE_BYTES = 10 * 1024 * 1024
+# Thumbnails never change for a given source URL, so browsers may keep them for a week
+CACHE_CONTROL = "public, max-age=604800, immutable"
+
+MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+def is_allowed_source(src: str) -> bool:
+    """
+    Whether `src` is an http(s) URL on an allowed image host.
+    """
+    parsed = urlparse(src)
+    host = parsed.hostname or ""
+    return parsed.scheme in ("http", "https") and any(
+        host == suffix or host.endswith("." + suffix) for suffix in ALLOWED_HOST_SUFFIXES
+    )
+
+
+def thumbnail_url(src: str, width: int = DEFAULT_THUMB_WIDTH) -> str:
+    """
+    Rewrite an image URL to go through the `/thumb` proxy. Other values (e.g. "No picture") are returned as-is.
+    """
+    if not is_allowed_source(src):
+        return src
+    return f"/thumb?src={quote(src, safe='')}&w={width}"
+
+
+def resize_image(data: bytes, width: int, image_format: str) -> bytes:
+    """
+    Downscale an image to at most `width` pixels wide (keeping the aspect ratio) and re-encode it.
+    """
+    with Image.open(BytesIO(data)) as image:
+        image.thumbnail((width, width * 4))
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        output = BytesIO()
+        image.save(output, format=image_format.upper(), quality=THUMB_QUALITY)
+        return output.getvalue()
+
+
+class ThumbnailCache:
+    """
+    On-disk cache of encoded thumbnails with an LRU size limit.
+    A file's modification time is its last use; the least recently used files are removed first.
+
+    Args:
+        directory (str): Cache directory, created if missing.
+        max_bytes (int): Total size limit of the cached files.
+    """
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as cache_file:
+                data = cache_file.read()
+            os.utime(path)  # Mark as recently used
+            return data
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        # Write to a temporary file first so readers never see a partial image
+        path = self._path(key)
+        temporary_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "wb") as cache_file:
+            cache_file.write(data)
+        with self._lock:
+            previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(temporary_path, path)
+            self.total_bytes += len(data) - previous_size
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Evict down to 90% of the limit, so eviction does not run on every write
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.is_file() and not entry.name.endswith(".tmp")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in entries:
+            if self.total_bytes <= self.max_bytes * 0.9:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self.total_bytes -= size
+            metrics.incr("thumb.evicted")
+        metrics.set_gauge("thumb.cache_bytes", self.total_bytes)
+
+
+_cache: Optional[ThumbnailCache] = None
+_client: Optional[httpx.AsyncClient] = None
+# Concurrent requests for the same thumbnail share one fetch
+_in_flight: Dict[str, asyncio.Task] = {}
+
+
+def _get_cache() -> ThumbnailCache:
+    global _cache
+    if _cache is None:
+        _cache = ThumbnailCache(THUMB_CACHE_DIR, THUMB_CACHE_MAX_BYTES)
+    return _cache
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=THUMB_FETCH_TIMEOUT_SECONDS, follow_redirects=False)
+    return _client
+
+
+async def _create_thumbnail(key: str, src: str, width: int, image_format: str) -> bytes:
+    try:
+        response = await _get_client().get(src)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        logger.warning("Failed to fetch image %s: %s", src, e)
+        raise HTTPException(status_code=502, detail="Failed to fetch image")
+    if len(response.content) > MAX_SOURCE_BYTES:
+        raise HTTPException(status_code=502, detail="Image too large")
+
+    try:
+        # Decoding and resizing is CPU work, keep it off the event loop
+        with metrics.timed("thumb.resize"):
+            data = await asyncio.to_thread(resize_image, response.content, width, image_format)
+    except (UnidentifiedImageError, OSError) as e:
+        logger.warning("Failed to resize image %s: %s", src, e)
+        raise HTTPException(status_code=502, detail="Invalid image")
+
+    await asyncio.to_thread(_get_cache().put, key, data)
+    return data
+
+
+def thumbnail_variant(src: str, width: int, accept: str = "") -> Tuple[int, str, str]:
+    """
+    Resolve the thumbnail variant for a request.
+
+    Args:
+        src (str): The source image URL (must be on an allowed host).
+        width (int): Requested width; rounded up to the nearest allowed width.
+        accept (str): The request's Accept header; WebP is used when the client supports it.
+
+    Returns:
+        Tuple[int, str, str]: Output width, image format and cache key (also used as ETag).
+    """
+    if not is_allowed_source(src):
+        raise HTTPException(status_code=400, detail="Image host not allowed")
+
+    width = next((allowed for allowed in THUMB_WIDTHS if allowed >= width), THUMB_WIDTHS[-1])
+    image_format = "webp" if "image/webp" in accept else "jpeg"
+    key = hashlib.sha256(f"{src}|{width}|{image_format}".encode("utf-8")).hexdigest()
+    return width, image_format, key
+
+
+async def get_thumbnail(src: str, width: int, image_format: str, key: str) -> bytes:
+    """
+    Return the encoded thumbnail, from the disk cache or freshly fetched, downscaled and cached.
+    """
+    data = await asyncio.to_thread(_get_cache().get, key)
+    if data is not None:
+        metrics.incr("thumb.cache_hit")
+    else:
+        metrics.incr("thumb.cache_miss")
+        task = _in_flight.get(key)
+        if task is None:
+            task = _in_flight[key] = asyncio.ensure_future(_create_thumbnail(key, src, width, image_format))
+            task.add_done_callback(lambda _: _in_flight.pop(key, None))
+        data = await asyncio.shield(task)
+
+    return data
+
+
+async def thumbnail_response(src: str, width: int, accept: str = "", if_none_match: Optional[str] = None) -> Response:
+    """
+    Build the HTTP response for the `/thumb` route, with cache headers and ETag revalidation.
+    """
+    width, image_format, key = thumbnail_variant(src, width, accept)
+    etag = f'"{key}"'
+    headers = {"Cache-Control": CACHE_CONTROL, "ETag": etag, "Vary": "Accept"}
+
+    # The key is derived from the request alone, so revalidation needs no fetch or disk read
+    if if_none_match == etag:
+        metrics.incr("thumb.not_modified")
+        return Response(status_code=304, headers=headers)
+
+    data = await get_thumbnail(src, width, image_format, key)
+    return Response(content=data, media_type=MEDIA_TYPES[image_format], headers=headers)
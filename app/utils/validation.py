@@ -0,0 +1,179 @@
+import ipaddress
+import os
+import re
+import time
+from typing import Callable, List, Optional, Tuple
+
+from utils.metrics import metrics
+from utils.logger import get_logger
+from utils.storage import StorageError, get_storage
+
+logger = get_logger("validation")
+
+# Precompiled once at import time instead of on every message
+JAPANESE_PATTERN = re.compile(r'[\u3040-\u30FF\u4E00-\u9FAF]')
+
+MIN_QUESTION_LENGTH = 3
+MAX_QUESTION_LENGTH = int(os.getenv("MAX_QUESTION_LENGTH", "500"))
+
+
+def is_japanese(text: str) -> bool:
+    """
+    Check if the given text contains Japanese characters.
+    """
+    return bool(JAPANESE_PATTERN.search(text))
+
+
+# -------------------------- Input Checks -------------------------- #
+# Each check returns a warning message for the user, or None if the question passes.
+
+def check_not_empty(question: str) -> Optional[str]:
+    if len(question) == 0:
+        return '質問を入力してから送信ボタンを押してください！'
+    return None
+
+
+def check_min_length(question: str) -> Optional[str]:
+    if len(question) < MIN_QUESTION_LENGTH:
+        return '質問を細かく書いてください！'
+    return None
+
+
+def check_max_length(question: str) -> Optional[str]:
+    if len(question) > MAX_QUESTION_LENGTH:
+        return f'質問は{MAX_QUESTION_LENGTH}文字以内で書いてください！'
+    return None
+
+
+def check_japanese(question: str) -> Optional[str]:
+    if not is_japanese(question):
+        return '日本語で書いてください！'
+    return None
+
+
+INPUT_CHECKS: List[Tuple[str, Callable[[str], Optional[str]]]] = [
+    ("not_empty", check_not_empty),
+    ("min_length", check_min_length),
+    ("max_length", check_max_length),
+    ("japanese", check_japanese),
+]
+
+
+def validate_question(question: str) -> Optional[str]:
+    """
+    Run the input checks in order and stop at the first failure.
+    Each check's latency is recorded in the `validation.<check>` timer.
+
+    Args:
+        question (str): The user's question.
+
+    Returns:
+        Optional[str]: The warning message to show, or None if the question is valid.
+    """
+    for check_name, check in INPUT_CHECKS:
+        with metrics.timed(f"validation.{check_name}"):
+            message = check(question)
+        if message is not None:
+            metrics.incr(f"validation.rejected.{check_name}")
+            return message
+    return None
+
+
+# -------------------------- Rate Limiting -------------------------- #
+class RateLimiter:
+    """
+    Fixed-window rate limiter: each key (session ID or client IP) may make `capacity` requests per
+    window of `capacity / refill_rate` seconds, i.e. bursts of `capacity` at an average of `refill_rate`
+    per second. Counters live in the storage backend, so with a shared backend the limits hold across
+    replicas, and expire with their window.
+
+    Args:
+        name (str): Name used in metrics and storage keys, e.g. "session" or "ip".
+        capacity (float): Burst size per key.
+        refill_rate (float): Requests allowed per second per key, on average.
+    """
+
+    def __init__(self, name: str, capacity: float, refill_rate: float) -> None:
+        self.name = name
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.window_seconds = capacity / refill_rate
+
+    def allow(self, key: str) -> bool:
+        """
+        Count one request for `key`. Returns False if the key is over its limit.
+        If the storage backend is unavailable, requests are allowed rather than blocking every user.
+        """
+        window = int(time.time() // self.window_seconds)
+        try:
+            count = get_storage().incr(f"rate:{self.name}:{key}:{window}", ttl=self.window_seconds)
+        except StorageError as e:
+            logger.warning("Rate limit check failed: %s", e)
+            count = 0
+        allowed = count <= self.capacity
+
+        metrics.incr(f"rate_limit.{self.name}.{'allowed' if allowed else 'rejected'}")
+        return allowed
+
+
+# Every message triggers LLM calls and possibly a scrape, so both limits are conservative.
+# The IP limit is higher than the session limit because several tabs/users may share one IP.
+session_rate_limiter = RateLimiter(
+    "session",
+    capacity=float(os.getenv("RATE_LIMIT_SESSION_BURST", "5")),
+    refill_rate=float(os.getenv("RATE_LIMIT_SESSION_PER_MINUTE", "6")) / 60,
+)
+ip_rate_limiter = RateLimiter(
+    "ip",
+    capacity=float(os.getenv("RATE_LIMIT_IP_BURST", "20")),
+    refill_rate=float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", "30")) / 60,
+)
+
+
+# Comma-separated addresses or networks of the load balancers/proxies in front of the app
+# (e.g. "10.0.0.0/8"). Only those are trusted to set X-Forwarded-For.
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(entry.strip(), strict=False)
+    for entry in os.getenv("TRUSTED_PROXIES", "").split(",")
+    if entry.strip()
+]
+
+
+def _is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+
+def resolve_client_ip(peer: Optional[str], forwarded_for: Optional[str]) -> str:
+    """
+    Return the address the per-IP rate limit applies to. Behind a load balancer the TCP peer is the
+    proxy, so X-Forwarded-For is read, but only when the peer is a trusted proxy: anyone else could
+    send any header value. The list is walked from the right, skipping trusted hops, so a client
+    cannot pick its own address by prepending entries.
+    """
+    if not peer:
+        return "unknown"
+    if not forwarded_for or not _is_trusted_proxy(peer):
+        return peer
+    for hop in reversed([hop.strip() for hop in forwarded_for.split(",") if hop.strip()]):
+        if not _is_trusted_proxy(hop):
+            return hop
+    return peer
+
+
+def check_rate_limit(session_id: str, client_ip: str) -> Optional[str]:
+    """
+    Apply the per-session and per-IP limits.
+
+    Returns:
+        Optional[str]: The warning message to show, or None if the request is allowed.
+    """
+    with metrics.timed("validation.rate_limit"):
+        allowed = session_rate_limiter.allow(session_id) and ip_rate_limiter.allow(client_ip)
+    if not allowed:
+        logger.warning("Rate limit exceeded (ip=%s)", client_ip)
+        return 'リクエストが多すぎます。しばらく待ってからもう一度送信してください！'
+    return None
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app imports its modules as top-level packages (`from utils.x import ...`), as when run from app/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
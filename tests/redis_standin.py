@@ -0,0 +1,131 @@
+"""
+Local stand-in for a Redis server, speaking just enough of the RESP protocol for `RedisBackend`
+(GET, MGET, SET with PX/NX, INCRBY, DEL, SELECT, AUTH, PING). Data is kept in memory.
+
+Run it by hand to try the Redis backend without a real server:
+    python tests/redis_standin.py 6399
+    STORAGE_BACKEND=redis://localhost:6399 python -m utils.storage   (from app/)
+"""
+import socket
+import socketserver
+import sys
+import threading
+import time
+from typing import List, Optional
+
+
+class RedisStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port: int = 0) -> None:
+        super().__init__(("127.0.0.1", port), _Handler)
+        # key -> (value, expires_at or None)
+        self.data = {}
+        self.lock = threading.Lock()
+        self.commands: List[List[bytes]] = []
+        self._connections = set()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "RedisStandIn":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        self.drop_connections()
+
+    def drop_connections(self) -> None:
+        """
+        Close every client connection, as a restarted or failed-over server would.
+        """
+        for connection in list(self._connections):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            connection.close()
+        self._connections.clear()
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, args: List[bytes]) -> bytes:
+        command = args[0].upper()
+        if command == b"PING":
+            return b"+PONG\r\n"
+        if command in (b"SELECT", b"AUTH"):
+            return b"+OK\r\n"
+        if command == b"GET":
+            return _bulk(self.get(args[1]))
+        if command == b"MGET":
+            return b"*%d\r\n" % (len(args) - 1) + b"".join(_bulk(self.get(key)) for key in args[1:])
+        if command == b"SET":
+            options = [option.upper() for option in args[3:]]
+            expires_at = None
+            if b"PX" in options:
+                expires_at = time.time() + int(args[3 + options.index(b"PX") + 1]) / 1000
+            if b"NX" in options and self.get(args[1]) is not None:
+                return b"$-1\r\n"
+            self.data[args[1]] = (args[2], expires_at)
+            return b"+OK\r\n"
+        if command == b"INCRBY":
+            current = self.get(args[1])
+            expires_at = self.data[args[1]][1] if current is not None else None
+            try:
+                value = int(current or 0) + int(args[2])
+            except ValueError:
+                return b"-ERR value is not an integer or out of range\r\n"
+            self.data[args[1]] = (str(value).encode(), expires_at)
+            return b":%d\r\n" % value
+        if command == b"DEL":
+            return b":%d\r\n" % (self.data.pop(args[1], None) is not None)
+        return b"-ERR unknown command '%s'\r\n" % args[0]
+
+
+def _bulk(value: Optional[bytes]) -> bytes:
+    return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _read_command(self) -> Optional[List[bytes]]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self) -> None:
+        self.server._connections.add(self.connection)
+        try:
+            while True:
+                args = self._read_command()
+                if args is None:
+                    return
+                with self.server.lock:
+                    self.server.commands.append(args)
+                    reply = self.server.execute(args)
+                self.wfile.write(reply)
+        except (OSError, ValueError):
+            # The connection was dropped by `drop_connections`
+            return
+
+
+if __name__ == "__main__":
+    server = RedisStandIn(int(sys.argv[1]) if len(sys.argv) > 1 else 6379)
+    print(f"Redis stand-in listening on 127.0.0.1:{server.port}")
+    server.serve_forever()
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from utils.dedupe import FIXTURE_PATH, NearDuplicateIndex, evaluate, is_near_duplicate, size_tokens
+
+
+@pytest.fixture(scope="module")
+def labelled_pairs():
+    with open(FIXTURE_PATH, encoding="utf-8") as fixture_file:
+        return json.load(fixture_file)
+
+
+def test_fixture_precision(labelled_pairs):
+    # A false positive hides a real listing from the user, so precision must be exact
+    result = evaluate(labelled_pairs)
+    assert result["false_positive"] == 0, result
+    assert result["recall"] >= 0.9, result
+
+
+@pytest.mark.parametrize("title, expected", [
+    ("BURTON スノーボードウェア 上下セット Mサイズ", {"m"}),
+    ("ＵＮＩＱＬＯ ウルトラライトダウン ネイビー Ｌ", {"l"}),
+    ("iPhone 13 128GB ミッドナイト", {"128gb"}),
+    ("ナイキ エアフォース1 26.0cm", {"26cm"}),
+    ("AirPods Pro MagSafe 充電ケース USB-C", set()),
+    ("ワンピース 全巻セット 1-107巻", set()),
+])
+def test_size_tokens(title, expected):
+    assert size_tokens(title) == expected
+
+
+def test_same_price_different_size_is_not_duplicate():
+    a = {"name": "BURTON スノーボードウェア 上下セット Mサイズ", "price": 12800}
+    b = {"name": "BURTON スノーボードウェア 上下セット Lサイズ", "price": 12800}
+    assert not is_near_duplicate(a, b)
+    # Without a size on one side, the titles and prices decide
+    assert is_near_duplicate(a, {"name": "BURTON スノーボードウェア 上下セット", "price": 12800})
+
+
+def test_index_checks_every_kept_listing():
+    index = NearDuplicateIndex()
+    index.add({"name": "スノーボード ブーツ BOA 黒 26cm", "price": 6000,
+               "thumbnail": "https://static.mercdn.net/thumb/item/webp/m1_1.jpg?100"})
+    index.add({"name": "ポケモンカード 151 BOX シュリンク付き", "price": 15000})
+
+    assert index.is_duplicate({"name": "ポケモンカード 151 BOX シュリンク付き！", "price": 14800})
+    assert not index.is_duplicate({"name": "スノーボード ブーツ BOA 黒 27cm", "price": 6000})
+    # The same listing seen again after the seller edited it
+    assert index.is_duplicate({"name": "【値下げ】ブーツ", "price": 5000,
+                               "thumbnail": "https://static.mercdn.net/thumb/item/webp/m1_1.jpg?200"})
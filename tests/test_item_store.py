@@ -0,0 +1,95 @@
+import pytest
+
+from components.item_store import ItemStore, parse_item_id, parse_number
+
+
+def _item(item_id, name, price, likes="0", description=""):
+    return {
+        "name": name,
+        "url": f"https://jp.mercari.com/item/{item_id}",
+        "price": price,
+        "likes": likes,
+        "description": description,
+    }
+
+
+FIRST_SEARCH = [
+    _item("m1", "BURTON スノーボードウェア 上下", "¥12,800", likes="10", description="美品です"),
+    _item("m2", "スノーボードウェア メンズ Lサイズ", "¥5,000", likes="3", description="使用感あり"),
+    _item("m3", "ゴアテックス ジャケット", "¥22,000", likes="25", description="スノーボードに最適"),
+]
+SECOND_SEARCH = [
+    _item("m4", "Nintendo Switch 本体", "¥25,000"),
+    _item("m2", "スノーボードウェア メンズ Lサイズ", "¥4,500", likes="4", description="値下げしました"),
+]
+
+
+@pytest.fixture
+def store():
+    store = ItemStore()
+    store.add_items(FIRST_SEARCH)
+    return store
+
+
+def test_parse_helpers():
+    assert parse_item_id("https://jp.mercari.com/item/m12345678") == "m12345678"
+    assert parse_item_id("https://jp.mercari.com/shops/product/AbC123") == "AbC123"
+    assert parse_number("¥12,800") == 12800
+    assert parse_number("") is None
+
+
+def test_positions_refer_to_latest_search(store):
+    assert [item["item_id"] for item in store.query(positions=[1, 3])] == ["m1", "m3"]
+
+    store.add_items(SECOND_SEARCH)
+    assert [item["item_id"] for item in store.query(positions=[1, 2])] == ["m4", "m2"]
+    # Position 3 belonged to the previous search only
+    assert store.query(positions=[3]) == []
+
+
+def test_query_by_item_ids(store):
+    items = store.query(item_ids=["m3", "m1"], order_by="price:asc")
+    assert [item["item_id"] for item in items] == ["m1", "m3"]
+    assert items[0]["position"] == 1
+
+
+@pytest.mark.parametrize("has_fts", [True, False])
+def test_text_matching(store, has_fts):
+    if has_fts and not store.has_fts:
+        pytest.skip("SQLite build has no FTS5 trigram tokenizer")
+    store.has_fts = has_fts
+
+    # Matches names and descriptions, by substring
+    matched = {item["item_id"] for item in store.query(text="スノーボード")}
+    assert matched == {"m1", "m2", "m3"}
+    assert [item["item_id"] for item in store.query(text="美品")] == ["m1"]
+    # Query syntax is taken literally
+    assert store.query(text='"OR') == []
+
+
+def test_short_text_uses_like(store):
+    # Shorter than a trigram, so FTS cannot match it
+    assert [item["item_id"] for item in store.query(text="上下")] == ["m1"]
+
+
+def test_price_filters_and_order(store):
+    items = store.query(min_price=5000, max_price=20000, order_by="price:desc")
+    assert [item["item_id"] for item in items] == ["m1", "m2"]
+    assert [item["item_id"] for item in store.query(order_by="num_likes:desc", limit=1)] == ["m3"]
+
+
+def test_re_adding_item_replaces_entry(store):
+    store.add_items(SECOND_SEARCH)
+
+    assert len(store) == 4
+    [item] = store.query(item_ids=["m2"])
+    assert item["price"] == "¥4,500"
+    assert item["position"] == 2
+    # The full-text index holds only the latest description
+    assert store.query(text="使用感あり") == []
+    assert [item["item_id"] for item in store.query(text="値下げ")] == ["m2"]
+
+
+def test_empty_search_is_ignored(store):
+    store.add_items([])
+    assert [item["item_id"] for item in store.query(positions=[1])] == ["m1"]
@@ -0,0 +1,105 @@
+import json
+
+from components.search_mercari import merge_candidates
+from utils.item_table import ItemTable
+
+
+def _row(item_id, price):
+    return {
+        "item_id": item_id,
+        "name": f"商品 {item_id}",
+        "url": f"https://jp.mercari.com/item/{item_id}",
+        "thumbnail": f"https://static.mercdn.net/thumb/item/webp/{item_id}_1.jpg",
+        "price": price,
+    }
+
+
+def _ids(table, indices):
+    return [table.columns["item_id"][index] for index in indices]
+
+
+def test_select_by_rank_and_price():
+    table = ItemTable()
+    table.merge([_row("a", 3000), _row("b", 1000), _row("c", None), _row("d", 2000)], "score:desc")
+
+    assert _ids(table, table.select("score:desc")) == ["a", "b", "c", "d"]
+    # Unknown prices drop out of price filters and sort last
+    assert _ids(table, table.select("score:desc", min_price=1500)) == ["a", "d"]
+    table.exhaustive.add("score:desc")
+    assert _ids(table, table.select("price:asc")) == ["b", "d", "a", "c"]
+    assert _ids(table, table.select("price:desc", max_price=2500)) == ["d", "b"]
+
+
+def test_can_sort_needs_listing_or_exhaustive_table():
+    table = ItemTable()
+    table.merge([_row("a", 3000), _row("b", 1000)], "score:desc")
+
+    assert table.can_sort("score:desc")
+    # The recommended listing is truncated: its items are not the cheapest ones
+    assert not table.can_sort("price:asc")
+    assert not table.can_sort("created_time:desc")
+
+    table.merge([_row("e", 500), _row("b", 1000)], "price:asc")
+    assert table.can_sort("price:asc")
+    assert _ids(table, table.select("price:asc")) == ["e", "b", "a"]
+
+    table.merge([_row("a", 3000)], "created_time:desc", exhaustive=True)
+    assert table.can_sort("price:desc")
+    assert table.can_sort("num_likes:desc")
+
+
+def test_merge_keeps_existing_items_and_adds_rank_columns():
+    table = ItemTable()
+    table.merge([_row("a", 3000), _row("b", 1000)], "score:desc")
+    table.merge([_row("c", 500), _row("a", 3000)], "created_time:desc")
+
+    assert len(table) == 3
+    assert _ids(table, table.select("created_time:desc")) == ["c", "a", "b"]
+    assert _ids(table, table.select("score:desc")) == ["a", "b", "c"]
+
+
+def test_merge_with_repeated_item_ids():
+    table = ItemTable()
+    table.merge([_row("a", 3000), _row("b", 1000), _row("a", 3000)], "score:desc")
+    table.merge([_row("c", 500)], "price:asc")
+
+    assert len(table) == 3
+    assert _ids(table, range(len(table))) == ["a", "b", "c"]
+    assert table.row(2)["item_id"] == "c"
+    assert _ids(table, table.select("price:asc")) == ["c", "b", "a"]
+    assert _ids(table, table.select("score:desc")) == ["a", "b", "c"]
+
+
+def test_round_trip_through_dict():
+    table = ItemTable()
+    table.merge([_row("a", 3000), _row("b", None)], "score:desc")
+    table.merge([_row("c", 500)], "price:asc", exhaustive=True)
+
+    restored = ItemTable.from_dict(json.loads(json.dumps(table.to_dict())))
+
+    assert restored.to_dict() == table.to_dict()
+    assert restored.row(1) == table.row(1) == _row("b", None)
+    assert restored.can_sort("price:desc")
+    assert _ids(restored, restored.select("score:desc")) == ["a", "b", "c"]
+    # Positions are rebuilt, so a later merge does not duplicate known items
+    restored.merge([_row("a", 3000), _row("d", 800)], "created_time:desc")
+    assert _ids(restored, range(len(restored))) == ["a", "b", "c", "d"]
+
+
+def test_merge_candidates_fuses_ranks():
+    first = [_row("a", 3000), _row("b", 1000), _row("c", 2000)]
+    second = [_row("c", 2000), _row("d", 500)]
+
+    # "c" is listed by both queries, so it outranks items listed once
+    merged = merge_candidates([first, second], "score:desc")
+    assert [row["item_id"] for row in merged] == ["c", "a", "b", "d"]
+
+
+def test_merge_candidates_price_order():
+    first = [_row("a", 3000), _row("b", None)]
+    second = [_row("c", 2000), _row("a", 3000), _row("d", 500)]
+
+    merged = merge_candidates([first, second], "price:asc")
+    assert [row["item_id"] for row in merged] == ["d", "c", "a", "b"]
+    merged = merge_candidates([first, second], "price:desc")
+    assert [row["item_id"] for row in merged] == ["a", "c", "d", "b"]
@@ -0,0 +1,150 @@
+import time
+
+import pytest
+
+from components import search_mercari
+from utils import resilience
+from utils.resilience import CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded, retry
+
+
+class Flaky:
+    """
+    Fails `failures` times with ConnectionError, then returns "ok".
+    """
+
+    def __init__(self, failures: int) -> None:
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self) -> str:
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("flaky")
+        return "ok"
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(resilience.time, "sleep", sleeps.append)
+    # Always use the longest backoff, so the deadline checks are deterministic
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: high)
+    return sleeps
+
+
+def test_deadline_stage_is_capped():
+    deadline = Deadline(10)
+    assert 3.9 < deadline.stage(0.4).seconds <= 4.0
+    assert deadline.stage(1.0, max_seconds=2).seconds == 2
+    assert Deadline(0).stage(0.5).seconds == 0
+    with pytest.raises(DeadlineExceeded):
+        Deadline(0).timeout_ms()
+
+
+def test_retry_until_success(no_sleep):
+    function = Flaky(failures=2)
+    assert retry(function, attempts=3, retry_on=(ConnectionError,), base_delay=0.5) == "ok"
+    assert function.calls == 3
+    assert no_sleep == [0.5, 1.0]
+
+
+def test_retry_gives_up_after_attempts(no_sleep):
+    function = Flaky(failures=5)
+    with pytest.raises(ConnectionError):
+        retry(function, attempts=2, retry_on=(ConnectionError,))
+    assert function.calls == 2
+
+
+def test_retry_ignores_other_exceptions(no_sleep):
+    def function():
+        raise ValueError("not transient")
+    with pytest.raises(ValueError):
+        retry(function, attempts=3, retry_on=(ConnectionError,))
+    assert no_sleep == []
+
+
+def test_retry_stops_when_backoff_does_not_fit_deadline(no_sleep):
+    function = Flaky(failures=1)
+    with pytest.raises(ConnectionError):
+        retry(function, attempts=3, retry_on=(ConnectionError,), deadline=Deadline(0.4), base_delay=0.5)
+    assert function.calls == 1
+    assert no_sleep == []
+
+
+def test_retry_keeps_minimum_budget_for_the_attempt(no_sleep):
+    function = Flaky(failures=1)
+    with pytest.raises(ConnectionError):
+        retry(function, attempts=3, retry_on=(ConnectionError,), deadline=Deadline(2),
+              base_delay=0.5, min_attempt_seconds=2)
+    assert function.calls == 1
+
+    function = Flaky(failures=1)
+    assert retry(function, attempts=3, retry_on=(ConnectionError,), deadline=Deadline(5),
+                 base_delay=0.5, min_attempt_seconds=2) == "ok"
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker("test_open", failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.check()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    # A success resets the count of consecutive failures
+    breaker.record_success()
+    for _ in range(3):
+        breaker.check()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def _open_breaker(name: str) -> CircuitBreaker:
+    breaker = CircuitBreaker(name, failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    # Pretend the reset timeout has passed
+    breaker.opened_at = time.monotonic() - 61
+    return breaker
+
+
+def test_half_open_allows_one_trial_call():
+    breaker = _open_breaker("test_half_open")
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_trial_reopens():
+    breaker = _open_breaker("test_reopen")
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_cancelled_trial_frees_slot():
+    breaker = _open_breaker("test_cancelled")
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_cancelled()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+
+def test_scrape_skipped_without_useful_budget(monkeypatch):
+    breaker = CircuitBreaker("test_low_budget", failure_threshold=1, reset_timeout=60)
+    monkeypatch.setattr(search_mercari, "mercari_breaker", breaker)
+    calls = []
+
+    with pytest.raises(DeadlineExceeded):
+        search_mercari._guarded(lambda: calls.append(1), Deadline(search_mercari.MIN_SCRAPE_SECONDS / 2))
+
+    assert calls == []
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
@@ -0,0 +1,73 @@
+import json
+
+from utils.semantic_cache import (
+    FIXTURE_PATH, HOLDOUT_FIXTURE_PATH, SIMILARITY_THRESHOLD, SemanticCache, evaluate, is_self_contained,
+)
+
+PLAN = {"keywords": "スノボウェア", "sort_order": "price:asc"}
+
+
+def _load(path):
+    with open(path, encoding="utf-8") as fixture_file:
+        return json.load(fixture_file)
+
+
+def test_labelled_pairs_have_full_precision_at_default_threshold():
+    assert evaluate(_load(FIXTURE_PATH), SIMILARITY_THRESHOLD)["precision"] == 1.0
+
+
+def test_held_out_pairs_at_default_threshold():
+    # Other products and wordings than the tuning set, so the threshold is not checked on its own data
+    result = evaluate(_load(HOLDOUT_FIXTURE_PATH), SIMILARITY_THRESHOLD)
+
+    assert result["precision"] == 1.0
+    assert result["recall"] >= 0.9
+
+
+def test_rewording_hits_cached_plan():
+    cache = SemanticCache(capacity=10, threshold=SIMILARITY_THRESHOLD)
+    cache.put("安いスノボウェア", PLAN)
+
+    assert cache.lookup("スノボウェアでお手頃なもの") == PLAN
+    assert cache.lookup("高いスノボウェア") is None
+    assert cache.lookup("安いスノボウェア メンズ") is None
+
+
+def test_every_keyword_must_appear_in_question():
+    assert is_self_contained("安いスノボウェア メンズ", "スノボウェア メンズ")
+    assert not is_self_contained("安いスノボウェア", "スノボウェア メンズ")
+    assert not is_self_contained("安いのは？", "")
+
+
+def test_plans_with_context_are_not_cached():
+    # A plan resolved with details from earlier turns (gender, budget) must not leak into other conversations
+    cache = SemanticCache(capacity=10, threshold=SIMILARITY_THRESHOLD)
+    cache.put("安いスノボウェア", {"keywords": "スノボウェア メンズ", "sort_order": "price:asc", "max_price": 5000})
+    cache.put("安いスノボウェア", {"keywords": "スノボウェア メンズ", "sort_order": "price:asc"})
+    cache.put("安いスノボウェア", {"keywords": "スノボウェア", "sort_order": "price:asc", "conditions": ["新品、未使用"]})
+
+    assert cache.size == 0
+    assert cache.lookup("スノボウェアでお手頃なもの") is None
+
+
+def test_follow_ups_and_numbers_are_neither_cached_nor_served():
+    cache = SemanticCache(capacity=10, threshold=SIMILARITY_THRESHOLD)
+    cache.put("もっと安いのは？", PLAN)
+    cache.put("3000円以下のスノボウェア", PLAN)
+    assert cache.size == 0
+
+    cache.put("安いスノボウェア", PLAN)
+    assert cache.lookup("もっと安いのは？") is None
+    assert cache.lookup("5000円以下の安いスノボウェア") is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticCache(capacity=2, threshold=SIMILARITY_THRESHOLD)
+    cache.put("安いスノボウェア", PLAN)
+    cache.put("ダウンジャケット", {"keywords": "ダウンジャケット", "sort_order": "score:desc"})
+    assert cache.lookup("安いスノボウェア") == PLAN
+
+    cache.put("ポケモンカード", {"keywords": "ポケモンカード", "sort_order": "score:desc"})
+
+    assert cache.lookup("ダウンジャケット") is None
+    assert cache.lookup("安いスノボウェア") == PLAN
@@ -0,0 +1,192 @@
+import socket
+import time
+
+import pytest
+
+from redis_standin import RedisStandIn
+from utils import storage
+from utils.storage import (
+    FORMAT_JSON, FORMAT_ZLIB_JSON, MemoryBackend, PrefixedStorage, RedisBackend, SQLiteBackend, StorageError,
+    create_backend, decode, encode,
+)
+
+DETAILS = {"name": "スノーボードウェア 上下セット", "price": "¥12,800", "description": "美品です。" * 100}
+
+
+@pytest.fixture
+def redis_server():
+    server = RedisStandIn().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    if request.param == "sqlite":
+        return SQLiteBackend(str(tmp_path / "storage.db"))
+    server = request.getfixturevalue("redis_server")
+    return RedisBackend("127.0.0.1", server.port)
+
+
+def _closed_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def test_encode_compresses_large_values_only():
+    small = encode({"a": 1})
+    large = encode(DETAILS)
+
+    assert small[0] == FORMAT_JSON and large[0] == FORMAT_ZLIB_JSON
+    assert len(large) < len(str(DETAILS).encode("utf-8"))
+    assert decode(small) == {"a": 1} and decode(large) == DETAILS
+
+
+def test_decode_rejects_corrupt_data():
+    with pytest.raises(StorageError):
+        decode(bytes([FORMAT_ZLIB_JSON]) + b"not zlib")
+    with pytest.raises(StorageError):
+        decode(b"\x07{}")
+
+
+def test_set_many_and_get_many_round_trip(backend):
+    backend.set_many({"item:m1": DETAILS, "item:m2": {"price": None}, "item:m3": [1, 2, 3]})
+
+    assert backend.get_many(["item:m1", "item:m2", "item:missing", "item:m3"]) == {
+        "item:m1": DETAILS, "item:m2": {"price": None}, "item:m3": [1, 2, 3],
+    }
+    assert backend.get_many([]) == {}
+
+    backend.delete("item:m1")
+    assert backend.get("item:m1") is None
+
+
+def test_values_expire_after_ttl(backend):
+    backend.set("short", "value", ttl=0.05)
+    backend.set("long", "value", ttl=60)
+    time.sleep(0.1)
+
+    assert backend.get_many(["short", "long"]) == {"long": "value"}
+
+
+def test_incr_counts_and_restarts_after_ttl(backend):
+    assert backend.incr("rate:session:s1", ttl=0.1) == 1
+    assert backend.incr("rate:session:s1", amount=2, ttl=0.1) == 3
+    assert backend.incr("rate:session:s2", ttl=0.1) == 1
+    time.sleep(0.15)
+
+    assert backend.incr("rate:session:s1", ttl=0.1) == 1
+
+
+def test_memory_counters_survive_cache_churn():
+    backend = MemoryBackend(max_entries=2, max_counters=10)
+    backend.incr("rate:session:s1", ttl=60)
+    backend.set_many({f"item:m{index}": DETAILS for index in range(20)})
+
+    assert backend.incr("rate:session:s1", ttl=60) == 2
+    assert len(backend.get_many([f"item:m{index}" for index in range(20)])) == 2
+
+
+def test_redis_batches_are_single_pipelined_commands(redis_server):
+    backend = RedisBackend("127.0.0.1", redis_server.port)
+    backend.set_many({"a": 1, "b": 2}, ttl=10)
+    backend.get_many(["a", "b", "c"])
+
+    assert [args[0] for args in redis_server.commands] == [b"SET", b"SET", b"MGET"]
+    assert redis_server.commands[0][3:] == [b"PX", b"10000"]
+
+
+def test_redis_error_reply_raises_storage_error(redis_server):
+    backend = RedisBackend("127.0.0.1", redis_server.port)
+
+    with pytest.raises(StorageError, match="unknown command"):
+        backend.execute(("NOSUCHCOMMAND",))
+    # The connection stays usable after an error reply
+    backend.set("a", 1)
+    assert backend.get("a") == 1
+
+
+def test_redis_reconnects_after_dropped_connection(redis_server):
+    backend = RedisBackend("127.0.0.1", redis_server.port)
+    backend.set("a", 1)
+    redis_server.drop_connections()
+
+    assert backend.get("a") == 1
+
+
+def test_unreachable_redis_raises_storage_error():
+    backend = RedisBackend("127.0.0.1", _closed_port())
+
+    with pytest.raises(StorageError):
+        backend.get("a")
+    with pytest.raises(StorageError):
+        backend.incr("a", ttl=1)
+
+
+def test_unreachable_redis_fails_fast_during_cooldown(monkeypatch):
+    port = _closed_port()
+    backend = RedisBackend("127.0.0.1", port)
+    connects = []
+    connect = backend._connect
+    monkeypatch.setattr(backend, "_connect", lambda: (connects.append(1), connect())[1])
+
+    for _ in range(3):
+        with pytest.raises(StorageError):
+            backend.get("a")
+    # One connection attempt, not one (or two) per call
+    assert len(connects) == 1
+
+    # Once the cooldown is over, the backend reconnects
+    server = RedisStandIn(port).start()
+    try:
+        backend._unavailable_until = 0.0
+        backend.set("a", 1)
+        assert backend.get("a") == 1
+    finally:
+        server.stop()
+
+
+def test_unusable_sqlite_path_raises_storage_error(tmp_path):
+    # The constructor does not touch the file, so get_storage() cannot fail with a raw sqlite3 error
+    backend = create_backend(f"sqlite:///{tmp_path}/missing/dir/cache.db")
+
+    with pytest.raises(StorageError):
+        backend.get("a")
+    with pytest.raises(StorageError):
+        backend.incr("a", ttl=1)
+
+
+def test_create_backend_parses_urls(tmp_path):
+    assert isinstance(create_backend("memory"), MemoryBackend)
+    assert create_backend(f"sqlite:///{tmp_path}/cache.db").path == f"{tmp_path}/cache.db"
+    redis = create_backend("redis://:secret@cache.internal:6380/2")
+    assert (redis.host, redis.port, redis.db, redis.password) == ("cache.internal", 6380, 2, "secret")
+    with pytest.raises(ValueError):
+        create_backend("memcached://localhost")
+
+
+@pytest.fixture(params=["redis", "sqlite"])
+def unreachable_storage_url(request, tmp_path):
+    if request.param == "redis":
+        return f"redis://127.0.0.1:{_closed_port()}"
+    return f"sqlite:///{tmp_path}/missing/dir/cache.db"
+
+
+def test_callers_degrade_when_storage_is_unreachable(monkeypatch, unreachable_storage_url):
+    from components import search_mercari
+    from utils.item_table import ItemTable
+    from utils.validation import check_rate_limit
+
+    # Built through get_storage(), as the app does
+    monkeypatch.setattr(storage, "STORAGE_BACKEND", unreachable_storage_url)
+    monkeypatch.setattr(storage, "_storage", None)
+
+    # Rate limits fail open, caches behave as misses and lost writes are ignored
+    assert check_rate_limit("session", "127.0.0.1") is None
+    assert search_mercari._get_table("スノボウェア") is None
+    search_mercari._store_table("スノボウェア", ItemTable())
+    assert search_mercari._get_cached_details(["m1"]) == {}
+    search_mercari._store_details({"m1": DETAILS})
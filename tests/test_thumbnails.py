@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from utils import thumbnails
+from utils.thumbnails import ThumbnailCache, thumbnail_response
+
+
+def _jpeg(width: int, height: int) -> bytes:
+    output = BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(output, format="JPEG")
+    return output.getvalue()
+
+
+# Path -> (content type, body) served by the fixture image server
+FIXTURES = {
+    "/photo.jpg": ("image/jpeg", _jpeg(800, 600)),
+    "/not-an-image.jpg": ("text/html", b"<html>not an image</html>"),
+}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        FixtureHandler.requests.append(self.path)
+        if self.path not in FIXTURES:
+            self.send_error(404)
+            return
+        content_type, body = FIXTURES[self.path]
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def image_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+@pytest.fixture
+def client(image_server, tmp_path, monkeypatch):
+    # Allow the fixture server, and give every test its own cache directory and HTTP client
+    monkeypatch.setattr(thumbnails, "ALLOWED_HOST_SUFFIXES", ("127.0.0.1",))
+    monkeypatch.setattr(thumbnails, "_cache", ThumbnailCache(str(tmp_path), 10 * 1024 * 1024))
+    monkeypatch.setattr(thumbnails, "_client", None)
+    FixtureHandler.requests.clear()
+
+    # Same route as main_page.py, without starting the NiceGUI app
+    app = FastAPI()
+
+    @app.get("/thumb")
+    async def get_thumb(request: Request, src: str, w: int = thumbnails.DEFAULT_THUMB_WIDTH):
+        return await thumbnail_response(
+            src, w, accept=request.headers.get("accept", ""), if_none_match=request.headers.get("if-none-match")
+        )
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def test_resizes_to_webp_when_accepted(client, image_server):
+    response = client.get("/thumb", params={"src": f"{image_server}/photo.jpg", "w": 150}, headers={"Accept": "image/webp,*/*"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert "immutable" in response.headers["cache-control"]
+    with Image.open(BytesIO(response.content)) as image:
+        assert image.format == "WEBP"
+        # 150 is rounded up to the allowed width 200, keeping the 4:3 aspect ratio
+        assert image.size == (200, 150)
+
+
+def test_falls_back_to_jpeg_without_webp_support(client, image_server):
+    response = client.get("/thumb", params={"src": f"{image_server}/photo.jpg", "w": 100}, headers={"Accept": "image/jpeg"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    with Image.open(BytesIO(response.content)) as image:
+        assert image.format == "JPEG"
+        assert image.size == (100, 75)
+
+
+def test_second_request_is_served_from_disk_cache(client, image_server):
+    params = {"src": f"{image_server}/photo.jpg", "w": 200}
+    first = client.get("/thumb", params=params)
+    second = client.get("/thumb", params=params)
+
+    assert first.content == second.content
+    assert FixtureHandler.requests == ["/photo.jpg"]
+
+
+def test_matching_etag_returns_304_without_fetching(client, image_server):
+    params = {"src": f"{image_server}/photo.jpg", "w": 200}
+    etag = client.get("/thumb", params=params).headers["etag"]
+    FixtureHandler.requests.clear()
+
+    response = client.get("/thumb", params=params, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert FixtureHandler.requests == []
+
+
+def test_disallowed_host_returns_400(client):
+    response = client.get("/thumb", params={"src": "http://example.com/photo.jpg"})
+
+    assert response.status_code == 400
+    assert FixtureHandler.requests == []
+
+
+def test_non_image_response_returns_502(client, image_server):
+    response = client.get("/thumb", params={"src": f"{image_server}/not-an-image.jpg"})
+
+    assert response.status_code == 502
+
+
+def test_missing_image_returns_502(client, image_server):
+    response = client.get("/thumb", params={"src": f"{image_server}/missing.jpg"})
+
+    assert response.status_code == 502
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ThumbnailCache(str(tmp_path), max_bytes=1000)
+    cache.put("a", b"a" * 400)
+    cache.put("b", b"b" * 400)
+    # Make both entries old, then use "a" so "b" is the least recently used
+    old = time.time() - 100
+    for key in ("a", "b"):
+        os.utime(tmp_path / key, (old, old))
+    assert cache.get("a") == b"a" * 400
+
+    cache.put("c", b"c" * 400)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.total_bytes == 800
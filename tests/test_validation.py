@@ -0,0 +1,32 @@
+import ipaddress
+
+import pytest
+
+from utils import validation
+from utils.validation import resolve_client_ip
+
+
+@pytest.fixture
+def trusted_proxies(monkeypatch):
+    monkeypatch.setattr(validation, "TRUSTED_PROXIES", [ipaddress.ip_network("10.0.0.0/8")])
+
+
+def test_forwarded_for_ignored_without_trusted_proxies():
+    assert resolve_client_ip("203.0.113.5", "198.51.100.7") == "203.0.113.5"
+
+
+def test_forwarded_for_ignored_from_untrusted_peer(trusted_proxies):
+    assert resolve_client_ip("203.0.113.5", "198.51.100.7") == "203.0.113.5"
+
+
+def test_forwarded_for_read_from_trusted_proxy(trusted_proxies):
+    assert resolve_client_ip("10.1.2.3", "198.51.100.7") == "198.51.100.7"
+
+
+def test_spoofed_forwarded_for_entries_are_skipped(trusted_proxies):
+    # The client prepended a fake address; the proxy appended the real one
+    assert resolve_client_ip("10.1.2.3", "1.2.3.4, 198.51.100.7, 10.4.5.6") == "198.51.100.7"
+
+
+def test_missing_peer():
+    assert resolve_client_ip(None, None) == "unknown"